@@ -0,0 +1,252 @@
+"""
+Headless batch mode: generate sitemaps for many GitHub repositories concurrently.
+
+Usage:
+    python batch_build_sitemaps.py repos.txt --concurrency 16 --report report.json
+    python batch_build_sitemaps.py orgs.txt --combined
+
+The input file has one repository URL per line (any format accepted by the
+app), or a user or organization URL (https://github.com/org) standing for
+all of its public repositories; blank lines and lines starting with # are
+ignored. With --combined, one sitemap index covering every repository is
+published instead of a sitemap per repository, and repositories with
+identical trees (e.g. unchanged forks) are only listed once. S3 credentials are
+read from the [aws_s3] section of .streamlit/secrets.toml (or another
+backend is picked with its [storage] section), unless --output-dir is given,
+in which case the sitemaps are written locally.
+GitHub tokens are read from the GITHUB_TOKENS environment variable.
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from components.cache import TreeCache
+from components.filters import DEFAULT_MAX_SIZE, build_file_filter
+from components.github import extract_account, extract_repo_details, list_files, raw_urls
+from components.gitrepo import GitMirror, list_files_from_clone
+from components.history import HistoryCache, sitemap_metadata
+from components.metrics import register_gauges, start_metrics_server, track_run
+from components.multirepo import account_targets, build_combined_sitemap, expand_targets, target_url
+from components.scheduler import GitHubScheduler, tokens_from_env
+from components.sitemap import publish_sitemap
+from components.storage import LocalStorage, storage_from_config
+
+logger = logging.getLogger('batch')
+
+
+def read_repo_urls(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def expand_accounts(repo_urls, session, include_forks=True, include_archived=True):
+    """Replace user and organization URLs with the URLs of their repositories."""
+    expanded = []
+    for url in repo_urls:
+        account = extract_account(url)
+        if account:
+            expanded.extend(target_url(target) for target in
+                            account_targets(account, session=session, include_forks=include_forks, include_archived=include_archived))
+        else:
+            expanded.append(url)
+    return expanded
+
+
+def create_session(concurrency):
+    # One pooled connection per worker, so workers never wait on each other for a socket
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_storage(secrets_path, output_dir, concurrency):
+    if output_dir:
+        return LocalStorage(output_dir)
+    with open(secrets_path, 'rb') as f:
+        config = tomllib.load(f)
+    config.setdefault('storage', {}).setdefault('max_pool_connections', max(32, concurrency * 4))
+    return storage_from_config(config)
+
+
+def process_repo(repo_url, session, cache, storage, file_filter=None, lastmod=False, priority=False, history=None, remote_url=None):
+    result = {'repo_url': repo_url, 'status': 'ok', 'files': 0, 'sitemap': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        with track_run() as run:
+            owner, repo, branch = extract_repo_details(repo_url)
+            if remote_url:
+                branch, commit, entries = list_files_from_clone(owner, repo, branch, file_filter=file_filter, remote_url=remote_url)
+            else:
+                branch, commit, entries = list_files(owner, repo, branch, session=session, cache=cache, file_filter=file_filter)
+            lastmods, priorities = sitemap_metadata(owner, repo, branch, commit, entries, lastmod=lastmod, priority=priority,
+                                                    cache=history, mirror=GitMirror(owner, repo, remote_url=remote_url))
+            result['sitemap'], result['files'], _ = publish_sitemap(raw_urls(owner, repo, branch, entries), storage,
+                                                                    lastmods=lastmods, priorities=priorities)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['metrics'] = run.summary()
+    logger.info(f"{repo_url}: {result['status']} in {result['seconds']}s ({result['files']} files)")
+    return result
+
+
+def summarize(results, elapsed):
+    latencies = sorted(r['seconds'] for r in results)
+    failures = [r for r in results if r['status'] != 'ok']
+    summary = {
+        'repos': len(results),
+        'succeeded': len(results) - len(failures),
+        'failed': len(failures),
+        'files': sum(r['files'] for r in results),
+        'elapsed_seconds': round(elapsed, 3),
+    }
+    stages = {}
+    for result in results:
+        for stage, seconds in result.get('metrics', {}).get('stages', {}).items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    summary['stage_seconds'] = {stage: round(seconds, 3) for stage, seconds in stages.items()}
+    if latencies:
+        summary['latency_seconds'] = {
+            'p50': round(statistics.median(latencies), 3),
+            'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+            'max': latencies[-1],
+        }
+    return summary
+
+
+def run_batch(repo_urls, concurrency=8, secrets_path='.streamlit/secrets.toml', output_dir=None, file_filter=None,
+              lastmod=False, priority=False, remote_url=None, include_forks=True, include_archived=True):
+    """
+    Generate a sitemap for every repository URL using a bounded thread pool.
+
+    Returns:
+        dict: {'summary': {...}, 'results': [per-repo results in input order]}
+    """
+    github = GitHubScheduler(tokens=tokens_from_env(), session=create_session(concurrency), max_concurrency=concurrency)
+    register_gauges('github', github.metrics)
+    cache = TreeCache()
+    storage = create_storage(secrets_path, output_dir, concurrency)
+    history = HistoryCache() if lastmod else None
+
+    start = time.perf_counter()
+    repo_urls = expand_accounts(repo_urls, github, include_forks=include_forks, include_archived=include_archived)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda url: process_repo(url, github, cache, storage, file_filter=file_filter,
+                                     lastmod=lastmod, priority=priority, history=history, remote_url=remote_url),
+            repo_urls))
+    summary = summarize(results, time.perf_counter() - start)
+    summary['github'] = github.metrics()
+    summary['peak_rss_bytes'] = max((r['metrics']['peak_rss_bytes'] or 0 for r in results), default=None) or None
+    return {'summary': summary, 'results': results}
+
+
+def run_combined(repo_urls, concurrency=8, secrets_path='.streamlit/secrets.toml', output_dir=None, file_filter=None,
+                 lastmod=False, priority=False, include_forks=True, include_archived=True):
+    """
+    Publish one sitemap index covering every repository, each distinct tree listed once.
+
+    Returns:
+        dict: {'summary': {...}, 'results': [per-repo results in input order]}
+    """
+    github = GitHubScheduler(tokens=tokens_from_env(), session=create_session(concurrency), max_concurrency=concurrency)
+    register_gauges('github', github.metrics)
+    storage = create_storage(secrets_path, output_dir, concurrency)
+
+    start = time.perf_counter()
+    with track_run() as run:
+        targets = expand_targets(repo_urls, session=github, include_forks=include_forks, include_archived=include_archived)
+        combined = build_combined_sitemap(targets, storage, session=github, cache=TreeCache(), file_filter=file_filter,
+                                          lastmod=lastmod, priority=priority, history=HistoryCache() if lastmod else None,
+                                          max_workers=concurrency)
+    metrics = run.summary()
+    results = [{'repo_url': target_url(target), 'status': target['status'], 'files': target['files'],
+                'commit': target['commit'], 'tree': target['tree'], 'duplicate_of': target['duplicate_of'],
+                'error': target['error']} for target in combined['repos']]
+    summary = {
+        'repos': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+        'failed': sum(1 for r in results if r['status'] == 'error'),
+        'distinct_trees': combined['distinct_trees'],
+        'files': combined['files'],
+        'sitemap': combined['url'],
+        'shards': combined['shards'],
+        'elapsed_seconds': round(time.perf_counter() - start, 3),
+        'stage_seconds': metrics['stages'],
+        'github': github.metrics(),
+        'peak_rss_bytes': metrics['peak_rss_bytes'],
+    }
+    return {'summary': summary, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate sitemaps for many GitHub repositories concurrently.')
+    parser.add_argument('input', help='File with one GitHub repository, user or organization URL per line')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of repositories processed at once (default: 8)')
+    parser.add_argument('--secrets', default='.streamlit/secrets.toml', help='Streamlit secrets file with the [aws_s3] settings')
+    parser.add_argument('--output-dir', help='Write sitemaps to this directory instead of uploading them to S3')
+    parser.add_argument('--include', action='append', default=[], help='Only include paths matching this gitignore-style glob (repeatable)')
+    parser.add_argument('--exclude', action='append', default=[], help='Also exclude paths matching this gitignore-style glob (repeatable)')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE, help='Skip files larger than this many bytes, 0 for no limit (default: 1 MiB)')
+    parser.add_argument('--no-default-filters', action='store_true', help='Keep binaries, lockfiles, vendored directories, etc.')
+    parser.add_argument('--lastmod', action='store_true', help='Add <lastmod> dates from the git history (needs git)')
+    parser.add_argument('--priority', action='store_true', help='Add <priority> values by file type and depth')
+    parser.add_argument('--clone', action='store_true', help='List files from local blobless clones instead of the REST trees API (needs git)')
+    parser.add_argument('--remote-url', help='Clone from this URL template instead of GitHub, e.g. file:///srv/git/{owner}/{repo}.git (implies --clone)')
+    parser.add_argument('--combined', action='store_true', help='Publish one sitemap index covering every repository, listing identical trees once')
+    parser.add_argument('--no-forks', action='store_true', help='Leave out forks when listing the repositories of users and organizations')
+    parser.add_argument('--no-archived', action='store_true', help='Leave out archived repositories when listing users and organizations')
+    parser.add_argument('--report', help='Write the JSON report to this file')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port while the batch runs')
+    parser.add_argument('--verbose', action='store_true', help='Log pipeline details for every repository')
+    args = parser.parse_args()
+    if args.combined and (args.clone or args.remote_url):
+        parser.error('--combined deduplicates repositories by their GitHub tree, so it cannot be used with --clone or --remote-url')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger('components').setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    file_filter = build_file_filter(args.include, args.exclude, not args.no_default_filters, args.max_size)
+    try:
+        if args.combined:
+            report = run_combined(read_repo_urls(args.input), concurrency=args.concurrency,
+                                  secrets_path=args.secrets, output_dir=args.output_dir, file_filter=file_filter,
+                                  lastmod=args.lastmod, priority=args.priority,
+                                  include_forks=not args.no_forks, include_archived=not args.no_archived)
+        else:
+            report = run_batch(read_repo_urls(args.input), concurrency=args.concurrency,
+                               secrets_path=args.secrets, output_dir=args.output_dir, file_filter=file_filter,
+                               lastmod=args.lastmod, priority=args.priority,
+                               remote_url=args.remote_url or ('https://github.com/{owner}/{repo}.git' if args.clone else None),
+                               include_forks=not args.no_forks, include_archived=not args.no_archived)
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+    for result in report['results']:
+        if result['status'] == 'error':
+            print(f"FAILED {result['repo_url']}: {result['error']}", file=sys.stderr)
+    print(json.dumps(report['summary'], indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report['summary']['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
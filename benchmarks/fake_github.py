@@ -0,0 +1,185 @@
+"""
+Local stand-in for the GitHub git trees API, serving synthetic repositories.
+
+Trees are generated deterministically from their size, so every run serves
+byte-identical responses. Like the real API, a recursive listing with more
+than `truncate_at` entries is cut short and flagged as truncated, which makes
+the pipeline fall back to walking the subtrees.
+"""
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from components.github import GITHUB_API_URL
+
+# GitHub truncates recursive tree listings at 100,000 entries
+TRUNCATE_AT = 100000
+
+FILES_PER_DIRECTORY = 100
+DIRECTORIES_PER_PACKAGE = 50
+
+TREE_PATH = re.compile(r'^/repos/[^/]+/[^/]+/git/trees/([0-9a-f]{40})$')
+
+
+def fake_sha(*parts):
+    return hashlib.sha1('/'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def synthetic_commit(files):
+    """Commit SHA of the synthetic repository with `files` files."""
+    return fake_sha('commit', files)
+
+
+class SyntheticRepo:
+    """
+    A repository of `files` blobs laid out as src/pkg{i}/mod{j}/file{k}.py,
+    with FILES_PER_DIRECTORY files per module and DIRECTORIES_PER_PACKAGE
+    modules per package, plus a README at the root.
+    """
+
+    def __init__(self, files, truncate_at=TRUNCATE_AT):
+        self.files = files
+        self.truncate_at = truncate_at
+        # tree sha -> list of (name, type, sha, size)
+        self.trees = {}
+        self.root = self._build(files)
+        self.commit = synthetic_commit(files)
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def _build(self, files):
+        packages = []
+        remaining, package = files - 1, 0
+        while remaining > 0:
+            modules = []
+            for module in range(DIRECTORIES_PER_PACKAGE):
+                if remaining <= 0:
+                    break
+                count = min(FILES_PER_DIRECTORY, remaining)
+                blobs = [(f'file{k}.py', 'blob', fake_sha(package, module, k), 1000 + k) for k in range(count)]
+                modules.append((f'mod{module}', 'tree', self._add(blobs), None))
+                remaining -= count
+            packages.append((f'pkg{package}', 'tree', self._add(modules), None))
+            package += 1
+        src = [('src', 'tree', self._add(packages), None)] if packages else []
+        return self._add([('README.md', 'blob', fake_sha('readme'), 2048)] + src)
+
+    def _add(self, items):
+        sha = fake_sha('tree', *(item[2] for item in items))
+        self.trees[sha] = items
+        return sha
+
+    def _listing(self, sha, recursive, prefix=''):
+        for name, kind, child, size in self.trees[sha]:
+            path = prefix + name
+            if kind == 'blob':
+                yield {'path': path, 'mode': '100644', 'type': 'blob', 'sha': child, 'size': size}
+            else:
+                yield {'path': path, 'mode': '040000', 'type': 'tree', 'sha': child}
+                if recursive:
+                    yield from self._listing(child, recursive, path + '/')
+
+    def tree_response(self, sha, recursive):
+        """The JSON body of GET /repos/{owner}/{repo}/git/trees/{sha}, or None for an unknown tree."""
+        if sha == self.commit:
+            sha = self.root
+        if sha not in self.trees:
+            return None
+        key = (sha, recursive)
+        with self._lock:
+            if key not in self._responses:
+                tree = []
+                truncated = False
+                for item in self._listing(sha, recursive):
+                    if len(tree) >= self.truncate_at:
+                        truncated = True
+                        break
+                    tree.append(item)
+                self._responses[key] = json.dumps({
+                    'sha': sha,
+                    'url': f'{GITHUB_API_URL}/repos/bench/repo/git/trees/{sha}',
+                    'tree': tree,
+                    'truncated': truncated,
+                }).encode('utf-8')
+            return self._responses[key]
+
+
+class _TreesRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        match = TREE_PATH.match(path)
+        body = None
+        if match:
+            for repo in self.server.repos:
+                body = repo.tree_response(match.group(1), 'recursive=1' in query)
+                if body is not None:
+                    break
+        if body is None:
+            body = b'{"message": "Not Found"}'
+            self.send_response(404)
+        else:
+            self.send_response(200)
+        self.server.requests += 1
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGitHub:
+    """
+    Serve the trees of the given SyntheticRepos on localhost from a daemon thread.
+
+    Usage:
+        repo = SyntheticRepo(50000)
+        with FakeGitHub([repo]) as github:
+            fetch_tree('bench', 'repo', repo.commit, session=local_session(github.url))
+    """
+
+    def __init__(self, repos, port=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _TreesRequestHandler)
+        self.server.daemon_threads = True
+        self.server.repos = list(repos)
+        self.server.requests = 0
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-github', daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+
+class LocalAPIAdapter(HTTPAdapter):
+    """Send requests for api.github.com to a local server instead, so the pipeline runs unmodified."""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.url[len(GITHUB_API_URL):]
+        return super().send(request, **kwargs)
+
+
+def local_session(base_url, pool_maxsize=16):
+    """A requests session whose GitHub API calls go to the fake server at base_url."""
+    session = requests.Session()
+    session.mount(GITHUB_API_URL, LocalAPIAdapter(base_url, pool_maxsize=pool_maxsize))
+    return session
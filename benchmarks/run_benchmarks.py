@@ -0,0 +1,186 @@
+"""
+Benchmark the sitemap pipeline against a local stand-in for the GitHub trees API.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --scenarios small medium --compare results.json
+
+Each scenario runs the real pipeline (scheduler, tree fetch and parsing, URL
+generation, sitemap serialization, upload and DataFrame building) on a
+synthetic repository served by benchmarks.fake_github, with sitemaps uploaded
+to in-memory (or local) storage. Scenarios run in their own process so the
+peak RSS of one doesn't carry over to the next. The first `--warmup`
+iterations are discarded; the results are per-stage latency percentiles and
+throughput in files per second, written as JSON for comparing runs.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_github import FakeGitHub, SyntheticRepo, local_session, synthetic_commit
+
+# name -> (files, entries per recursive listing before GitHub truncates it)
+SCENARIOS = {
+    'small': (1000, 100000),
+    'medium': (50000, 100000),
+    'medium-truncated': (50000, 5000),
+    'large': (500000, 100000),
+}
+
+STAGES = ('tree_fetch', 'url_build', 'sitemap_write', 'upload', 'dataframe')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(files, api_url, repeat=5, warmup=1, storage='memory'):
+    """Run the pipeline `warmup + repeat` times in this process and return the kept run summaries."""
+    from components.github import get_raw_urls
+    from components.logger import generate_sitemap_dataframe
+    from components.metrics import peak_rss_bytes, stage, track_run
+    from components.scheduler import GitHubScheduler
+    from components.sitemap import publish_sitemap
+    from components.storage import LocalStorage, MemoryStorage
+
+    github = GitHubScheduler(session=local_session(api_url), max_concurrency=16)
+    commit = synthetic_commit(files)
+    baseline_rss = peak_rss_bytes()
+    samples = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for iteration in range(warmup + repeat):
+            # A fresh backend every time, so content-addressed uploads are never skipped
+            backend = LocalStorage(os.path.join(tmpdir, str(iteration))) if storage == 'local' else MemoryStorage()
+            with track_run() as run:
+                urls = get_raw_urls('bench', 'repo', commit, session=github)
+                publish_sitemap(urls, backend)
+                with stage('dataframe'):
+                    generate_sitemap_dataframe(urls)
+            del urls, backend
+            if iteration >= warmup:
+                samples.append(run.summary())
+    return {'samples': samples, 'baseline_rss_bytes': baseline_rss, 'peak_rss_bytes': peak_rss_bytes()}
+
+
+def summarize_scenario(name, files, truncate_at, result):
+    samples = result['samples']
+    stages = {}
+    for stage_name in STAGES + ('total',):
+        seconds = [s['total_seconds'] if stage_name == 'total' else s['stages'].get(stage_name, 0.0) for s in samples]
+        p50 = statistics.median(seconds)
+        stages[stage_name] = {
+            'p50': round(p50, 4),
+            'p95': round(percentile(seconds, 0.95), 4),
+            'max': round(max(seconds), 4),
+            'files_per_second': round(files / p50) if p50 else None,
+        }
+    return {
+        'scenario': name,
+        'files': files,
+        'truncated': files > truncate_at,
+        'iterations': len(samples),
+        'stages': stages,
+        'counters': samples[-1]['counters'],
+        'baseline_rss_bytes': result['baseline_rss_bytes'],
+        'peak_rss_bytes': result['peak_rss_bytes'],
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'git_commit': commit,
+    }
+
+
+def run_benchmarks(names, repeat=5, warmup=1, storage='memory'):
+    """
+    Serve each scenario's repository from a fake GitHub server and run the
+    scenario in a child process.
+
+    Returns:
+        dict: {'environment': {...}, 'settings': {...}, 'scenarios': {name: {...}}}
+    """
+    report = {
+        'environment': environment(),
+        'settings': {'repeat': repeat, 'warmup': warmup, 'storage': storage},
+        'scenarios': {},
+    }
+    for name in names:
+        files, truncate_at = SCENARIOS[name]
+        # Repositories of the same size share their commit SHA, so each scenario gets a server of its own
+        with FakeGitHub([SyntheticRepo(files, truncate_at)]) as github:
+            child = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.run_benchmarks', '--child', str(files), '--api-url', github.url,
+                 '--repeat', str(repeat), '--warmup', str(warmup), '--storage', storage],
+                capture_output=True, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"Scenario {name} failed:\n{child.stderr}")
+        report['scenarios'][name] = summarize_scenario(name, files, truncate_at, json.loads(child.stdout))
+        print(f"{name}: {report['scenarios'][name]['stages']['total']['p50']}s p50", file=sys.stderr)
+    return report
+
+
+def compare(baseline, report):
+    """Format the p50 change of every stage against a previous report."""
+    lines = [f"{'scenario':<18} {'stage':<14} {'before':>9} {'after':>9} {'change':>8}"]
+    for name, scenario in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for stage_name, stats in scenario['stages'].items():
+            old = before['stages'].get(stage_name, {}).get('p50')
+            if not old:
+                continue
+            lines.append(f"{name:<18} {stage_name:<14} {old:>9.4f} {stats['p50']:>9.4f} {(stats['p50'] - old) / old:>+8.1%}")
+        old_rss, new_rss = before.get('peak_rss_bytes'), scenario.get('peak_rss_bytes')
+        if old_rss and new_rss:
+            lines.append(f"{name:<18} {'peak RSS (MB)':<14} {old_rss / 2**20:>9.1f} {new_rss / 2**20:>9.1f} {(new_rss - old_rss) / old_rss:>+8.1%}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sitemap pipeline against a local fake of the GitHub trees API.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS), help='Scenarios to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured iterations per scenario (default: 5)')
+    parser.add_argument('--warmup', type=int, default=1, help='Discarded iterations per scenario (default: 1)')
+    parser.add_argument('--storage', choices=['memory', 'local'], default='memory', help='Upload to memory or to a temporary directory')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', help='Print the change against a previous JSON report')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--api-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        json.dump(run_scenario(args.child, args.api_url, args.repeat, args.warmup, args.storage), sys.stdout)
+        return 0
+
+    start = time.perf_counter()
+    report = run_benchmarks(args.scenarios, args.repeat, args.warmup, args.storage)
+    report['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
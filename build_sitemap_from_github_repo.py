@@ -1,189 +1,309 @@
 import streamlit as st
-import requests
-import uuid
-import xml.etree.ElementTree as ET
-import boto3
-import re
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from components.copy import display_copy_button
-from components.logger import StreamHandler, display_log, generate_sitemap_dataframe, render_table
+from components.logger import LOG_VERBOSITY, StreamHandler, display_log, display_metrics, generate_sitemap_dataframe, render_table
+from components.cache import TreeCache
+from components.filters import DEFAULT_MAX_SIZE, build_file_filter, parse_patterns
+from components.github import GITHUB_URL, GitHubAPIError, RateLimitError, extract_account, extract_repo_details, list_files, raw_base_url, raw_urls, resolve_ref
+from components.gitrepo import GitError, GitMirror, list_files_from_clone
+from components.history import HistoryCache, sitemap_metadata
+from components.incremental import ManifestStore, sync_manifest
+from components.jobs import JobQueue, report_progress
+from components.metrics import bind_context, register_gauges, stage, start_metrics_server
+from components.multirepo import build_combined_sitemap, expand_targets, split_sources
+from components.scheduler import GitHubScheduler, tokens_from_env
+from components.sitemap import UPLOAD_WORKERS, publish_sitemap, upload_sitemap_file, write_sitemap_index
+from components.storage import storage_from_config
 
-logger = StreamHandler.setup_logging()
+logger = StreamHandler.setup_logging(__name__)
 page_title = 'GitHub Repository Sitemap Generator'
 
-# S3 config
-accountid = st.secrets['aws_s3']['accountid'] or ''
-access_key_id = st.secrets['aws_s3']['access_key_id'] or ''
-access_key_secret = st.secrets['aws_s3']['access_key_secret'] or ''
+# Loggers whose records go into the log of each sitemap job
+RUN_LOGGERS = ('components', __name__)
 
-# S3 buckets setup
+# Sitemap storage (S3 unless configured otherwise in the [storage] secrets section)
 @st.cache_resource()
-def s3_db():
-    s3 = boto3.client('s3',
-        endpoint_url = f'https://{accountid}.s3.amazonaws.com/',
-        aws_access_key_id = access_key_id,
-        aws_secret_access_key = access_key_secret
-    )
-    return s3
+def sitemap_storage():
+    return storage_from_config(st.secrets)
+
+# GitHub request scheduler, shared by every session of the app
+@st.cache_resource()
+def github_client():
+    tokens = list(st.secrets.get('github', {}).get('tokens', [])) or tokens_from_env()
+    scheduler = GitHubScheduler(tokens=tokens)
+    # Rate-limit budget, queue depth, etc. on /metrics
+    register_gauges('github', scheduler.metrics)
+    return scheduler
+
+# GitHub tree cache
+@st.cache_resource()
+def tree_cache():
+    return TreeCache()
+
+# Per-branch manifests for incremental updates
+@st.cache_resource()
+def manifest_store():
+    return ManifestStore()
+
+# Prometheus metrics endpoint, when a port is set in [metrics] or METRICS_PORT
+@st.cache_resource()
+def metrics_server():
+    port = st.secrets.get('metrics', {}).get('port') or os.environ.get('METRICS_PORT')
+    if port:
+        return start_metrics_server(int(port))
+
+# Last-change dates of files, by blob SHA
+@st.cache_resource()
+def history_cache():
+    return HistoryCache()
+
+@st.cache_resource()
+def job_queue():
+    return JobQueue(loggers=RUN_LOGGERS)
 
-def extract_repo_details(repo_url):
+def clone_remote_url():
     """
-    Extract owner, repository name, and branch from a GitHub URL.
-    Supports various GitHub URL formats including:
-    - https://github.com/owner/repo
-    - https://github.com/owner/repo.git
-    - git@github.com:owner/repo.git
-    - https://github.com/owner/repo/tree/branch
-    
-    Args:
-        repo_url (str): GitHub repository URL
-        
-    Returns:
-        tuple: (owner, repo, branch)
+    Remote URL (template) to list files from with a local clone, when the
+    [ingestion] section sets backend = "clone"; None to use the REST API.
     """
-    # Clean up the URL first
-    repo_url = repo_url.strip()
-    
-    # Extract owner and repo name, handling optional .git suffix
-    base_pattern = r"github\.com[:/]([\w-]+)/([\w.-]+?)(?:\.git)?(?:/|$)"
-    base_match = re.search(base_pattern, repo_url)
-    if not base_match:
-        raise ValueError("Invalid GitHub repository URL provided.")
-    
-    owner, repo = base_match.groups()
-    
-    # Extract branch if specified in the URL
-    # This handles formats like /tree/main or /tree/feature/branch
-    branch_pattern = r"/tree/([^/]+(?:/[^/]+)*)"
-    branch_match = re.search(branch_pattern, repo_url)
-    branch = branch_match.group(1) if branch_match else None
-    
-    # Log the extracted details
-    st.session_state.logs.append(
-        f"Extracted repository details - "
-        f"Owner: {owner}, "
-        f"Repo: {repo}, "
-        f"Branch: {branch if branch else 'default'}"
-    )
-    
-    return owner, repo, branch
+    ingestion = st.secrets.get('ingestion', {})
+    if ingestion.get('backend', 'api') != 'clone':
+        return None
+    return ingestion.get('remote_url') or f'{GITHUB_URL}/{{owner}}/{{repo}}.git'
 
-def get_raw_urls(owner, repo, branch=None):
-    # If no branch specified, try both main and master
-    branches_to_try = [branch] if branch else ['main', 'master']
-    
-    for try_branch in branches_to_try:
-        try:
-            # GitHub API URL to fetch repository contents
-            api_url = f'https://api.github.com/repos/{owner}/{repo}/git/trees/{try_branch}?recursive=1'
-            st.session_state.logs.append(f"Trying API URL: {api_url}")
-            response = requests.get(api_url)
-            
-            if response.status_code == 200:
-                st.session_state.logs.append(f"Successfully accessed branch: {try_branch}")
-                data = response.json()
-                
-                if 'tree' not in data:
-                    st.session_state.logs.append(f"No 'tree' found in response for branch {try_branch}")
-                    continue
-                    
-                urls = []
-                # Base URL for raw content
-                base_raw_url = f'https://raw.githubusercontent.com/{owner}/{repo}/{try_branch}/'
-                st.session_state.logs.append(f"Using base raw URL: {base_raw_url}")
-                
-                # Loop through the contents of the repository
-                for file in data.get('tree', []):
-                    if file['type'] == 'blob':
-                        raw_url = base_raw_url + file['path']
-                        urls.append(raw_url)
-                
-                if urls:  # Only return if we found some files
-                    st.session_state.logs.append(f"Found {len(urls)} files in branch {try_branch}")
-                    return urls
-                else:
-                    st.session_state.logs.append(f"No files found in branch {try_branch}, trying next option...")
-            else:
-                st.session_state.logs.append(f"Branch {try_branch} not accessible (Status: {response.status_code}, Response: {response.text}), trying next option...")
-                
-        except Exception as e:
-            st.session_state.logs.append(f"Error processing branch {try_branch}: {str(e)}")
-            continue  # Try next branch if there's an error processing this one
-    
-    # If we get here, none of the branches worked
-    raise ValueError(f"Could not access repository content. Tried branches: {', '.join(branches_to_try)}. Please ensure the repository exists, is public, and contains files.")
-
-def generate_sitemap(urls):
-    all_urls = []
-    good_urls = 0
-    for url in urls:
-        st.session_state.logs.append(f"Adding raw URL: {url}")
-        logger.info(f"Adding raw URL: {url}")
-        all_urls.append(url)
-        good_urls += 1
-    
-    if good_urls > 0:
-        st.session_state.logs.append(f"{good_urls} GitHub files were found and added. Generating sitemap ...")
-        logger.info(f"{good_urls} GitHub files were found and added. Generating sitemap ...")
-        st.success(f"{good_urls} GitHub files were found and added. Generating sitemap ...")
+def resolve_branch(owner, repo, branch=None, remote_url=None):
+    """Resolve the branch to build (the default one if None) to its head commit, on the clone's remote if given."""
+    try:
+        with stage('resolve'):
+            if remote_url:
+                return GitMirror(owner, repo, remote_url=remote_url).remote_head(branch)
+            return resolve_ref(owner, repo, branch, session=github_client())
+    except RateLimitError:
+        raise
+    except (GitHubAPIError, GitError) as e:
+        logger.info(f"Branch {branch if branch else 'default'} not accessible ({str(e)})")
+        raise ValueError(f"Could not access repository content for branch {branch if branch else 'default'}. Please ensure the repository exists, is public, and contains files.")
+
+def generate_sitemap(owner, repo, branch, session, cache, storage, file_filter=None, lastmod=False, priority=False,
+                     history=None, remote_url=None):
+    """
+    Publish the sitemap of a repository branch, optionally with <lastmod> dates
+    from the git history and <priority> values. Files are listed with the REST
+    API, or from a local clone of `remote_url` when given. Runs on the job
+    queue, so it must not call Streamlit.
+    """
+    report_progress(0.1, "Fetching the repository's file list")
+    if remote_url:
+        branch, commit, entries = list_files_from_clone(owner, repo, branch, file_filter=file_filter, remote_url=remote_url)
     else:
-        st.session_state.logs.append('No files were found in the repository. Sitemap Generation Stopped....')
+        branch, commit, entries = list_files(owner, repo, branch, session=session, cache=cache, file_filter=file_filter)
+    urls = raw_urls(owner, repo, branch, entries)
+    if lastmod:
+        report_progress(0.3, "Dating files from the git history")
+    lastmods, priorities = sitemap_metadata(owner, repo, branch, commit, entries, lastmod=lastmod, priority=priority, cache=history,
+                                            mirror=GitMirror(owner, repo, remote_url=remote_url))
+    report_progress(0.5, f"Writing and uploading the sitemap of {len(urls)} files")
+    url, good_urls, shard_count = publish_sitemap(urls, storage, lastmods=lastmods, priorities=priorities)
+
+    if good_urls == 0:
         logger.error('No files were found in the repository. Sitemap Generation Stopped....')
-        st.error("No files were found in the repository.")
-        return
+        raise ValueError("No files were found in the repository.")
 
-    # Create XML Document
-    urlset = ET.Element("urlset", xmlns="http://www.sitemaps.org/schemas/sitemap/0.9")
-    for url in all_urls:
-        url_element = ET.SubElement(urlset, "url")
-        loc_element = ET.SubElement(url_element, "loc")
-        loc_element.text = url
-
-    # Generate the XML sitemap
-    sitemap_xml = ET.tostring(urlset, encoding="unicode", method="xml")
-    df = generate_sitemap_dataframe(sitemap_xml)
-
-    # Upload to S3
-    s3 = s3_db()
-    unique_filename = f'{uuid.uuid4()}.xml'
-    content_type = 'application/xml'
-    s3.put_object(Body=sitemap_xml, Bucket=accountid, Key=unique_filename, ACL='public-read', ContentType=content_type)
-    url = f'https://{accountid}.s3.amazonaws.com/{accountid}/{unique_filename}'
-    st.session_state.logs.append(f'Successfully generated Sitemap: {url}')
     logger.info(f'Successfully generated Sitemap: {url}')
-    st.success("Success! Copy the sitemap link below and use it in CustomGPT.ai to build a RAG-based coding assistant based on your repo files")
-    display_copy_button(url)
-    render_table(df)
+    report_progress(0.9, "Preparing the file table")
+    with stage('dataframe'):
+        df = generate_sitemap_dataframe(urls, lastmods)
+    return {'url': url, 'df': df, 'message': f"{good_urls} GitHub files were found and added to the sitemap."}
+
+def generate_incremental_sitemap(owner, repo, branch, head, session, cache, storage, store, file_filter=None):
+    """
+    Patch the previously published sitemap of a repository branch, rewriting only the shards whose files changed.
+    The sitemap index is published under a stable key, so the link stays the same across runs.
+    Runs on the job queue, so it must not call Streamlit.
+    """
+    report_progress(0.1, "Finding the files that changed since the last run")
+    with stage('manifest_sync'):
+        update = sync_manifest(owner, repo, branch, store, session=session, cache=cache, head=head, file_filter=file_filter)
+
+    logger.info(
+        f"Manifest for {owner}/{repo}@{branch} synced to {update.commit} ({update.mode}): "
+        f"{len(update.added)} added, {len(update.removed)} removed, {len(update.dirty)} shards to rewrite",
+        extra={'stage': 'manifest', 'counts': {'added': len(update.added), 'removed': len(update.removed), 'files': len(update.files)}}
+    )
+    if not update.files:
+        raise ValueError("No files were found in the repository.")
+
+    report_progress(0.5, f"Rewriting {len(update.dirty)} of {update.shard_count} sitemap shards")
+    prefix = f'{owner.lower()}/{repo.lower()}/{branch}'
+    base_raw_url = raw_base_url(owner, repo, branch)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def publish_shard(shard):
+            path = update.write_shard(shard, tmpdir, base_raw_url)
+            return upload_sitemap_file(storage, path, f'{prefix}/sitemap-{shard}.xml')
+
+        with stage('upload'):
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+                list(pool.map(bind_context(publish_shard), sorted(update.dirty)))
+            logger.info(f"Rewrote sitemap shards: {', '.join(str(shard) for shard in sorted(update.dirty))}",
+                        extra={'stage': 'upload', 'counts': {'uploaded': len(update.dirty)}})
+            index_key = f'{prefix}/sitemap.xml'
+            url = storage.url(index_key)
+            if update.index_dirty:
+                shard_urls = [storage.url(f'{prefix}/sitemap-{shard}.xml')
+                              for shard in range(1, update.shard_count + 1)]
+                index_path = write_sitemap_index(os.path.join(tmpdir, 'sitemap.xml'), shard_urls)
+                upload_sitemap_file(storage, index_path, index_key)
+    store.save(update)
+
+    logger.info(f'Successfully updated Sitemap: {url}')
+    report_progress(0.9, "Preparing the file table")
+    with stage('dataframe'):
+        df = generate_sitemap_dataframe(base_raw_url + path for path in sorted(update.files))
+    return {'url': url, 'df': df,
+            'message': f"{len(update.files)} GitHub files are in the sitemap ({len(update.dirty)} of {update.shard_count} shards rewritten)."}
 
-    return sitemap_xml
+def generate_combined_sitemap(sources, session, cache, storage, file_filter=None, lastmod=False, priority=False, history=None):
+    """
+    Publish one sitemap index covering several repositories and/or every
+    repository of users or organizations, listing repositories with
+    identical trees once. Runs on the job queue, so it must not call Streamlit.
+    """
+    report_progress(0.05, "Listing the repositories")
+    targets = expand_targets(sources, session=session)
+    report_progress(0.2, f"Listing the files of {len(targets)} repositories")
+    combined = build_combined_sitemap(targets, storage, session=session, cache=cache, file_filter=file_filter,
+                                      lastmod=lastmod, priority=priority, history=history)
+    if combined['url'] is None:
+        logger.error('No files were found in the repositories. Sitemap Generation Stopped....')
+        raise ValueError("No files were found in the repositories.")
+
+    logger.info(f"Successfully generated Sitemap: {combined['url']}")
+    report_progress(0.9, "Preparing the file table")
+    with stage('dataframe'):
+        df = generate_sitemap_dataframe(chain.from_iterable(urls for urls, lastmods in combined['sitemaps']),
+                                        chain.from_iterable(lastmods for urls, lastmods in combined['sitemaps']) if lastmod else None)
+    statuses = [target['status'] for target in combined['repos']]
+    return {'url': combined['url'], 'df': df,
+            'message': f"{combined['files']} GitHub files from {statuses.count('ok')} repositories were added to the sitemap index "
+                       f"({statuses.count('duplicate')} duplicate repositories skipped, {statuses.count('error')} failed)."}
+
+def submit_job(repo_url, incremental, file_options, log_level, lastmod=False, priority=False):
+    """Queue the sitemap generation of a repository, or join an identical one already in progress."""
+    file_filter = build_file_filter(**file_options)
+    file_key = tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in sorted(file_options.items()))
+    sources = split_sources(repo_url)
+    if len(sources) > 1 or (sources and extract_account(sources[0])):
+        if incremental:
+            raise ValueError("Incremental updates work on a single repository.")
+        # Heads are resolved by the job, which may have to list whole organizations first
+        key = ('combined', lastmod, priority, tuple(source.lower() for source in sources), file_key)
+        return job_queue().submit(key, generate_combined_sitemap, sources, github_client(), tree_cache(), sitemap_storage(),
+                                  file_filter=file_filter, lastmod=lastmod, priority=priority, history=history_cache(),
+                                  log_level=log_level)
+    owner, repo, branch = extract_repo_details(repo_url)
+    logger.info(f"Found repository: {owner}/{repo} (branch: {branch})")
+    # Incremental updates patch the manifest through the REST API, whatever the ingestion backend
+    remote_url = None if incremental else clone_remote_url()
+    branch, head = resolve_branch(owner, repo, branch, remote_url=remote_url)
+
+    # Same repository, commit and options means the same sitemap
+    key = (incremental, lastmod, priority, owner.lower(), repo.lower(), branch, head, file_key)
+    if incremental:
+        return job_queue().submit(key, generate_incremental_sitemap, owner, repo, branch, head, github_client(), tree_cache(),
+                                  sitemap_storage(), manifest_store(), file_filter=file_filter, log_level=log_level)
+    return job_queue().submit(key, generate_sitemap, owner, repo, branch, github_client(), tree_cache(),
+                              sitemap_storage(), file_filter=file_filter, lastmod=lastmod, priority=priority,
+                              history=history_cache(), remote_url=remote_url, log_level=log_level)
+
+@st.fragment(run_every=1.0)
+def display_job_progress(job_id):
+    job = job_queue().get(job_id)
+    if job is None or job.finished:
+        # Rerun the whole page to show the result
+        st.rerun()
+    st.progress(job.progress, text=job.message)
+
+def display_job(job_id):
+    job = job_queue().get(job_id)
+    if job is None:
+        st.warning("This sitemap job is no longer available. Please generate the sitemap again.")
+        return
+    if not job.finished:
+        display_job_progress(job_id)
+        return
+
+    if job.status == 'failed':
+        if isinstance(job.error, ValueError):
+            st.error(f"Error: {str(job.error)}")
+        else:
+            st.error(f"An unexpected error occurred: {str(job.error)}")
+    else:
+        st.success(job.result['message'])
+        st.success("Success! Copy the sitemap link below and use it in CustomGPT.ai to build a RAG-based coding assistant based on your repo files")
+    display_log(job.log)
+
+    if job.status == 'done':
+        display_copy_button(job.result['url'])
+        with stage('render', run=job.metrics):
+            render_table(job.result['df'])
+    display_metrics(job.metrics.summary())
 
 def main():
     st.sidebar.title('Navigation')
     page = st.sidebar.radio('Go to', ['Home', 'Instructions', 'FAQ'])
+    verbosity = st.sidebar.selectbox('Log verbosity', list(LOG_VERBOSITY), index=1)
+    metrics_server()
     
     if page == 'Home':
         st.info("This free tool lets you build a sitemap from your GitHub repository. This sitemap can then be used to build a RAG-based coding assistant using [CustomGPT.ai](https://customgpt.ai/) that will answer questions and generate code based on your repo's content. [Live Demo](https://app.customgpt.ai/projects/62249/ask-me-anything?embed=1&shareable_slug=88c28738c70071387a3a36a312eb4f27)")
         
         with st.form(key='github_form'):
-            repo_url = st.text_input("Enter your GitHub repository URL:", placeholder="https://github.com/adorosario/github-raw-urls")
+            repo_url = st.text_input("Enter your GitHub repository URL:", placeholder="https://github.com/adorosario/github-raw-urls",
+                                     help="Or a user or organization URL (https://github.com/org), or several repository URLs separated by spaces, for one sitemap index covering them all")
+            incremental = st.checkbox("Incremental update (keep a stable sitemap link and only rewrite what changed since the last run)")
+            with st.expander("Sitemap metadata (not available for incremental updates)"):
+                lastmod = st.checkbox("Add last-modified dates from the git history")
+                priority = st.checkbox("Add priorities: READMEs and docs first, tests and deeply nested files last")
+            with st.expander("File filters"):
+                use_default_filters = st.checkbox("Skip binaries, media, lockfiles, minified bundles and vendored directories", value=True)
+                max_size_mb = st.number_input("Skip files larger than (MB, 0 for no limit)", min_value=0.0, value=DEFAULT_MAX_SIZE / (1024 * 1024), step=0.5)
+                include_patterns = st.text_area("Only include paths matching (gitignore-style globs, one per line)", placeholder="docs/\n*.md")
+                exclude_patterns = st.text_area("Also exclude paths matching (gitignore-style globs, one per line)", placeholder="tests/\n*.csv")
             submit_button = st.form_submit_button(label='Generate Sitemap')
             
         if submit_button:
             if repo_url:
                 try:
-                    owner, repo, branch = extract_repo_details(repo_url)
-                    st.session_state.logs.append(f"Found repository: {owner}/{repo} (branch: {branch})")
-                    raw_urls = get_raw_urls(owner, repo, branch)
-                    generate_sitemap(raw_urls)
+                    file_options = {
+                        'include': parse_patterns(include_patterns),
+                        'exclude': parse_patterns(exclude_patterns),
+                        'use_defaults': use_default_filters,
+                        'max_size': int(max_size_mb * 1024 * 1024),
+                    }
+                    job, coalesced = submit_job(repo_url, incremental, file_options, LOG_VERBOSITY[verbosity],
+                                                lastmod=lastmod and not incremental, priority=priority and not incremental)
+                    # Kept in the URL so a refresh goes back to the same job
+                    st.query_params['job'] = job.id
+                    if coalesced:
+                        st.info("This sitemap is already being generated for someone else; you'll get the same result.")
                 except ValueError as e:
+                    st.query_params.pop('job', None)
                     st.error(f"Error: {str(e)}")
-                    st.session_state.logs.append(f'Error: {str(e)}')
+                    logger.error(f'Error: {str(e)}')
                 except Exception as e:
+                    st.query_params.pop('job', None)
                     st.error(f"An unexpected error occurred: {str(e)}")
-                    st.session_state.logs.append(f'Error: {str(e)}')
+                    logger.error(f'Error: {str(e)}')
             else:
+                st.query_params.pop('job', None)
                 st.error("Please enter a GitHub repository URL")
-                st.session_state.logs.append('No repository URL entered')
-            display_log(st.session_state.logs)
+                logger.error('No repository URL entered')
+
+        if 'job' in st.query_params:
+            display_job(st.query_params['job'])
 
     elif page == 'Instructions':
         st.header("Instructions")
@@ -206,14 +326,16 @@ def main():
 
         ### What URL formats are supported?
         The tool supports several GitHub repository URL formats:
-        - Main branch: `https://github.com/username/repository`
+        - Default branch (main, master, develop, ...): `https://github.com/username/repository`
         - Specific branch: `https://github.com/username/repository/tree/branch-name`
         - Repository URLs ending with or without .git
         - Both HTTPS and SSH URLs (e.g., `git@github.com:username/repository.git`)
+        - A user or organization: `https://github.com/organization`, for one sitemap index covering all of its public repositories
+        - Several repository (or organization) URLs separated by spaces, for one sitemap index covering them all. Forks and mirrors with the same files are only listed once
 
         ### What types of repositories work best?
         Repositories containing documentation, markdown files, code or other text-based content work best for creating informative chatbots.
-        - Large binary files or media files may not be suitable for RAG-based training
+        - Large binary files or media files may not be suitable for RAG-based training, so by default images, media, archives, compiled files, lockfiles, minified bundles, vendored directories (e.g. `node_modules/`) and files over 1 MB are left out of the sitemap. You can change this under "File filters".
         - Documentation and comments in code are valuable. 
         - Markdown (.md) files, especially those containing explanations and documentation, are ideal
 
@@ -221,7 +343,7 @@ def main():
         Currently, this tool only works with public repositories.
 
         ### How many files can be included?
-        The tool supports repositories with up to 50,000 files, which is the standard sitemap limit.
+        There is no hard limit. A single sitemap holds up to 50,000 files (the standard sitemap limit); larger repositories are split into several sitemaps and the link you get points to a sitemap index that lists all of them.
 
         ### What are the limitations of RAG-based coding assistants?
         While RAG-based assistants can be helpful for code understanding and documentation, they have some important limitations:
@@ -242,5 +364,4 @@ if __name__ == "__main__":
         menu_items={"About": page_title},
     )
     st.title(page_title)
-    st.session_state.logs = []
     main()
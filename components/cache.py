@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+
+from components.manifest import Manifest
+
+DEFAULT_CACHE_DIR = os.environ.get('GITHUB2CUSTOMGPT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'github2customgpt'))
+
+
+class TreeCache:
+    """
+    On-disk (SQLite) cache of GitHub repository trees.
+
+    Two tables are kept:
+    - refs:  (owner, repo, ref) -> ETag and tree SHA of the last successful
+             response, used to send If-None-Match on the next request.
+    - trees: (owner, repo, tree SHA) -> compressed Manifest of the blobs.
+
+    A ref checked less than `fresh_for` seconds ago is served without any
+    request. Trees that have not been used for `ttl` seconds are evicted, and
+    the least recently used trees are dropped once the stored entries go over
+    `max_bytes`.
+    """
+
+    def __init__(self, path=None, fresh_for=60, ttl=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, 'trees.sqlite3')
+        self.path = path
+        self.fresh_for = fresh_for
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS refs (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    ref TEXT NOT NULL,
+                    etag TEXT,
+                    tree_sha TEXT NOT NULL,
+                    checked_at REAL NOT NULL,
+                    PRIMARY KEY (owner, repo, ref)
+                );
+                CREATE TABLE IF NOT EXISTS trees (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    tree_sha TEXT NOT NULL,
+                    truncated INTEGER NOT NULL,
+                    entries BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (owner, repo, tree_sha)
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return closing(conn)
+
+    def lookup(self, owner, repo, ref):
+        """
+        Look up the cached tree for a ref.
+
+        Returns:
+            tuple: (etag, tree, fresh) where tree is None on a miss and fresh
+            tells whether the entry can be used without revalidating it.
+        """
+        owner, repo = owner.lower(), repo.lower()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT etag, tree_sha, checked_at FROM refs WHERE owner = ? AND repo = ? AND ref = ?',
+                (owner, repo, ref)).fetchone()
+            if row is None:
+                return None, None, False
+            etag, tree_sha, checked_at = row
+            tree = self._load_tree(conn, owner, repo, tree_sha)
+            if tree is None:
+                return None, None, False
+            return etag, tree, time.time() - checked_at < self.fresh_for
+
+    def get_tree(self, owner, repo, tree_sha):
+        with self._connect() as conn:
+            return self._load_tree(conn, owner.lower(), repo.lower(), tree_sha)
+
+    def touch(self, owner, repo, ref):
+        """Record a successful revalidation (304) of a ref."""
+        with self._connect() as conn, conn:
+            conn.execute('UPDATE refs SET checked_at = ? WHERE owner = ? AND repo = ? AND ref = ?',
+                         (time.time(), owner.lower(), repo.lower(), ref))
+
+    def store(self, owner, repo, ref, etag, tree):
+        owner, repo = owner.lower(), repo.lower()
+        blob = zlib.compress(json.dumps(tree['entries'].to_json(), separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO trees VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (owner, repo, tree['sha'], int(tree['truncated']), blob, len(blob), now))
+            conn.execute('INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?, ?)',
+                         (owner, repo, ref, etag, tree['sha'], now))
+            self._evict(conn, now)
+
+    def _load_tree(self, conn, owner, repo, tree_sha):
+        row = conn.execute(
+            'SELECT truncated, entries FROM trees WHERE owner = ? AND repo = ? AND tree_sha = ?',
+            (owner, repo, tree_sha)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute('UPDATE trees SET last_used = ? WHERE owner = ? AND repo = ? AND tree_sha = ?',
+                         (time.time(), owner, repo, tree_sha))
+        truncated, blob = row
+        return {
+            'sha': tree_sha,
+            'truncated': bool(truncated),
+            # Trees cached before manifests were compact are plain lists of entries
+            'entries': Manifest.from_json(json.loads(zlib.decompress(blob))),
+        }
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM trees WHERE last_used < ?', (now - self.ttl,))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM trees').fetchone()[0]
+        if total > self.max_bytes:
+            rows = conn.execute('SELECT owner, repo, tree_sha, size FROM trees ORDER BY last_used').fetchall()
+            for owner, repo, tree_sha, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM trees WHERE owner = ? AND repo = ? AND tree_sha = ?', (owner, repo, tree_sha))
+                total -= size
+        # Refs pointing at evicted trees are useless
+        conn.execute("""
+            DELETE FROM refs WHERE NOT EXISTS (
+                SELECT 1 FROM trees
+                WHERE trees.owner = refs.owner AND trees.repo = refs.repo AND trees.tree_sha = refs.tree_sha
+            )
+        """)
@@ -0,0 +1,168 @@
+import hashlib
+import re
+
+from components.manifest import Manifest
+
+# Dependencies, build output and generated files that add noise, not knowledge
+DEFAULT_EXCLUDE = [
+    'node_modules/', 'bower_components/', 'vendor/', 'third_party/', '.git/',
+    'dist/', 'build/', 'out/', 'target/', '__pycache__/', '.venv/', 'venv/',
+    '*.min.js', '*.min.css', '*.map', '*.bundle.js', '*.chunk.js',
+    '*.lock', 'package-lock.json', 'pnpm-lock.yaml', 'go.sum', 'npm-shrinkwrap.json',
+]
+
+# Binary and media formats that can't be used for RAG training
+DEFAULT_DENY_EXTENSIONS = [
+    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico', 'icns', 'webp', 'tif', 'tiff', 'psd', 'ai', 'eps',
+    'mp3', 'mp4', 'm4a', 'wav', 'ogg', 'flac', 'avi', 'mov', 'mkv', 'webm',
+    'zip', 'tar', 'gz', 'tgz', 'bz2', 'xz', '7z', 'rar', 'jar', 'war', 'whl', 'egg',
+    'exe', 'dll', 'so', 'dylib', 'a', 'o', 'obj', 'lib', 'class', 'pyc', 'pyo', 'bin', 'wasm',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'db', 'sqlite', 'sqlite3', 'pkl', 'pickle', 'npy', 'npz', 'h5', 'hdf5', 'parquet', 'feather',
+    'onnx', 'pt', 'pth', 'ckpt', 'safetensors', 'tflite', 'iso', 'dmg', 'img',
+]
+
+DEFAULT_MAX_SIZE = 1024 * 1024
+
+
+def glob_to_regex(pattern):
+    """
+    Translate one gitignore-style glob into a regex for repository paths.
+
+    - A pattern without a slash (other than a trailing one) matches at any depth.
+    - A leading or inner slash anchors the pattern to the repository root.
+    - A trailing slash only matches directories, i.e. everything below them.
+    - '*' and '?' don't cross '/', '**' does.
+
+    Returns:
+        tuple: (anchored, regex) where an anchored regex must match at the
+        start of the path and an unanchored one at the start of any component
+    """
+    directory_only = pattern.endswith('/')
+    # Only the trailing slash goes before the anchoring check: a leading one anchors
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex, i = '', 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex += '/.*'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            members = pattern[i + 1:end]
+            # '!' (or '^') negates only as the first character; a negated class still doesn't match '/'
+            negated = members[0] in '!^'
+            members = members[1:] if negated else members
+            members = members.replace('\\', '\\\\').replace('^', '\\^').replace('[', '\\[')
+            regex += ('[^/' if negated else '[') + members + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    # A directory pattern covers everything under it; a plain pattern may also name a directory
+    suffix = '/' if directory_only else '(?:/|$)'
+    return anchored, regex + suffix
+
+
+def compile_globs(patterns):
+    """Compile a list of globs into a single regex, so each path is matched once, not once per pattern."""
+    patterns = [p.strip() for p in patterns if p.strip() and not p.strip().startswith('#')]
+    if not patterns:
+        return None
+    anchored, unanchored = [], []
+    for pattern in patterns:
+        is_anchored, regex = glob_to_regex(pattern)
+        (anchored if is_anchored else unanchored).append(regex)
+    # Factoring the anchors out of the alternation means alternatives are only
+    # tried at the start of the path and right after a '/'
+    parts = []
+    if anchored:
+        parts.append('^(?:' + '|'.join(anchored) + ')')
+    if unanchored:
+        parts.append('(?:^|/)(?:' + '|'.join(unanchored) + ')')
+    return re.compile('|'.join(parts))
+
+
+class FileFilter:
+    """
+    Decides which files of a repository tree go into the sitemap.
+
+    A file is kept when it matches the include globs (if any), does not match
+    the exclude globs (unless re-included by a '!pattern' exclude entry),
+    has an allowed extension (if an allow list is given) and no denied one,
+    and is not larger than max_size bytes. All globs are precompiled into one
+    regex per list, and extensions are checked with set lookups, so the cost
+    per path is constant in the number of patterns.
+    """
+
+    def __init__(self, include=None, exclude=DEFAULT_EXCLUDE, allow_extensions=None,
+                 deny_extensions=DEFAULT_DENY_EXTENSIONS, max_size=DEFAULT_MAX_SIZE):
+        exclude = list(exclude or [])
+        self.include = compile_globs(include or [])
+        self.exclude = compile_globs([p for p in exclude if not p.startswith('!')])
+        self.reinclude = compile_globs([p[1:] for p in exclude if p.startswith('!')])
+        self.allow_extensions = {e.lower().lstrip('.') for e in allow_extensions} if allow_extensions else None
+        self.deny_extensions = {e.lower().lstrip('.') for e in deny_extensions or []}
+        self.max_size = max_size
+        # Same fingerprint, same files kept: tells whether a stored listing was built with this filter
+        options = (sorted(include or []), sorted(exclude), sorted(self.allow_extensions or []),
+                   self.allow_extensions is None, sorted(self.deny_extensions), max_size)
+        self.fingerprint = hashlib.sha1(repr(options).encode('utf-8')).hexdigest()
+
+    def matches(self, path, size=None):
+        if self.max_size is not None and size is not None and size > self.max_size:
+            return False
+
+        name = path.rsplit('/', 1)[-1]
+        extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+        if self.allow_extensions is not None and extension not in self.allow_extensions:
+            return False
+        if extension in self.deny_extensions:
+            return False
+
+        if self.include is not None and not self.include.search(path):
+            return False
+        if self.exclude is not None and self.exclude.search(path):
+            return self.reinclude is not None and self.reinclude.search(path) is not None
+        return True
+
+    def filter(self, entries):
+        """Keep the matching entries of a Manifest (or list of [path, size, sha] entries), as a Manifest."""
+        if not isinstance(entries, Manifest):
+            entries = Manifest(entries)
+        return entries.select(i for i, (path, size) in enumerate(zip(entries.paths(), entries.sizes()))
+                              if self.matches(path, size))
+
+
+def parse_patterns(text):
+    """Split user input (one pattern per line or comma-separated) into a list of patterns."""
+    return [p.strip() for p in re.split(r'[\n,]', text or '') if p.strip()]
+
+
+def build_file_filter(include=None, exclude=None, use_defaults=True, max_size=DEFAULT_MAX_SIZE):
+    """
+    Build a FileFilter from user options: extra include/exclude globs on top
+    of (or instead of) the default exclusions, and a size cutoff in bytes
+    (None or 0 for no limit).
+    """
+    return FileFilter(
+        include=include,
+        exclude=(DEFAULT_EXCLUDE if use_defaults else []) + list(exclude or []),
+        deny_extensions=DEFAULT_DENY_EXTENSIONS if use_defaults else [],
+        max_size=max_size or None,
+    )
@@ -0,0 +1,628 @@
+import codecs
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from components.manifest import Manifest, RawURLs
+from components.metrics import bind_context, count, stage
+
+GITHUB_API_URL = 'https://api.github.com'
+GITHUB_URL = 'https://github.com'
+
+COMMIT_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+# How long resolved refs are reused before being looked up again
+REF_TTL = 60
+
+# Resolved refs kept at most, oldest dropped first
+MAX_RESOLVED_REFS = 4096
+
+# Bytes of a tree response parsed at a time
+TREE_CHUNK_SIZE = 256 * 1024
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+logger = logging.getLogger(__name__)
+
+
+class GitHubAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"Status: {status_code}, Response: {message}")
+        self.status_code = status_code
+
+
+class RateLimitError(GitHubAPIError):
+    """The request was refused because of rate limiting, not because the resource is missing."""
+
+
+def fetch_tree(owner, repo, ref, session=requests, cache=None, max_workers=8):
+    """
+    Fetch the recursive tree of a repository ref, going through the tree cache if one is given.
+
+    A cached ref that was checked recently is returned without any request.
+    Otherwise the request is sent with If-None-Match, and a 304 response
+    reuses the cached entries without downloading or parsing the tree again.
+    Trees that GitHub truncates are completed with walk_tree.
+
+    Args:
+        owner (str): Repository owner
+        repo (str): Repository name
+        ref (str): Branch, tag or commit SHA
+        session: requests module or requests.Session used for the call
+        cache (TreeCache): Optional tree cache
+        max_workers (int): Parallel subtree requests when the tree is truncated
+
+    Returns:
+        tuple: (tree, source) where tree is a dict with 'sha', 'truncated' and
+        'entries' (a Manifest of every blob), and source is
+        one of 'cache', 'revalidated' or 'api'
+    """
+    etag, cached, fresh = cache.lookup(owner, repo, ref) if cache else (None, None, False)
+    # The tree of a commit never changes, so it never needs revalidating
+    if cached is not None and (fresh or COMMIT_SHA_PATTERN.match(ref)):
+        return cached, 'cache'
+
+    headers = {'Accept': 'application/vnd.github+json'}
+    if cached is not None and etag:
+        headers['If-None-Match'] = etag
+
+    api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1'
+    # Streamed, so the (possibly 100 MB) body is parsed as it arrives instead of being held whole
+    response = session.get(api_url, headers=headers, stream=True)
+
+    if response.status_code == 304 and cached is not None:
+        response.close()
+        cache.touch(owner, repo, ref)
+        return cached, 'revalidated'
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text)
+
+    data, entries, _ = read_tree(response)
+    if data.get('truncated'):
+        logger.info(f"Tree {data['sha']} of {owner}/{repo} is truncated, fetching its subtrees",
+                    extra={'stage': 'tree', 'counts': {'truncated': 1}})
+        entries = walk_tree(owner, repo, data['sha'], session=session, max_workers=max_workers)
+    tree = {
+        'sha': data['sha'],
+        'truncated': False,
+        'entries': entries,
+    }
+    if cache:
+        cache.store(owner, repo, ref, response.headers.get('ETag'), tree)
+    return tree, 'api'
+
+
+def _decoded_chunks(response, chunk_size):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in response.iter_content(chunk_size):
+        count('github_bytes', len(chunk))
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def parse_tree_stream(chunks, on_item):
+    """
+    Parse a git trees API response (a JSON object with a 'tree' array) from
+    text chunks, handing each element of the array to `on_item` as soon as
+    it is complete, so the whole array is never held in memory.
+
+    Args:
+        chunks (iterable): Text chunks of the response body
+        on_item (callable): Called with every (decoded) element of 'tree'
+
+    Returns:
+        dict: The other members of the object (e.g. 'sha' and 'truncated')
+    """
+    decoder = json.JSONDecoder()
+    scan_once, skip_whitespace, number_tail = decoder.scan_once, _JSON_WHITESPACE.match, _JSON_NUMBER_TAIL.match
+    chunks = iter(chunks)
+    buffer, pos = '', 0
+
+    def more():
+        nonlocal buffer, pos
+        for chunk in chunks:
+            if chunk:
+                buffer, pos = buffer[pos:] + chunk, 0
+                return True
+        return False
+
+    def peek():
+        nonlocal pos
+        while True:
+            pos = skip_whitespace(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not more():
+                raise ValueError("Tree response ended unexpectedly")
+
+    def expect(*chars):
+        nonlocal pos
+        char = peek()
+        if char not in chars:
+            raise ValueError(f"Unexpected {char!r} in tree response, expected one of {chars}")
+        pos += 1
+        return char
+
+    def complete(decoded, end):
+        # A number cut by a chunk boundary decodes as a shorter one ('1.' as 1,
+        # leaving '.'), so it is only complete once a non-number character follows
+        if type(decoded) not in (int, float):
+            return True
+        return number_tail(buffer, end).end() < len(buffer)
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                decoded, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # An incomplete value: wait for the rest of it
+                if not more():
+                    raise
+                continue
+            if complete(decoded, end) or not more():
+                pos = end
+                return decoded
+
+    members, has_tree = {}, False
+    expect('{')
+    if peek() == '}':
+        raise ValueError("No 'tree' found in response")
+    while True:
+        key = value()
+        expect(':')
+        if key == 'tree':
+            has_tree = True
+            expect('[')
+            if peek() == ']':
+                pos += 1
+            else:
+                # The hot loop, one call per file: elements are scanned in place and
+                # only go through value() when they straddle a chunk boundary
+                while True:
+                    try:
+                        item, end = scan_once(buffer, pos)
+                    except (StopIteration, json.JSONDecodeError):
+                        item = value()
+                    else:
+                        if complete(item, end):
+                            pos = end
+                        else:
+                            item = value()
+                    on_item(item)
+                    if pos < len(buffer) and buffer[pos] == ',':
+                        pos = skip_whitespace(buffer, pos + 1).end()
+                        continue
+                    if expect(',', ']') == ']':
+                        break
+                    peek()
+        else:
+            members[key] = value()
+        if expect(',', '}') == '}':
+            break
+    if not has_tree:
+        raise ValueError("No 'tree' found in response")
+    return members
+
+
+def read_tree(response, chunk_size=TREE_CHUNK_SIZE):
+    """
+    Read a git trees API response incrementally into a Manifest of its blobs.
+
+    Returns:
+        tuple: (data, blobs, subtrees) where data holds the top-level members
+        other than 'tree' ('sha', 'truncated'), blobs is a Manifest and
+        subtrees lists (path, sha) of the tree entries
+    """
+    blobs, subtrees = Manifest(), []
+    append_blob = blobs.append
+
+    def on_item(item):
+        if item['type'] == 'blob':
+            append_blob(item['path'], item.get('size'), item['sha'])
+        elif item['type'] == 'tree':
+            subtrees.append((item['path'], item['sha']))
+
+    try:
+        data = parse_tree_stream(_decoded_chunks(response, chunk_size), on_item)
+    except ValueError as e:
+        raise GitHubAPIError(response.status_code, f"Invalid tree response: {str(e)}")
+    finally:
+        response.close()
+    return data, blobs, subtrees
+
+
+def walk_tree(owner, repo, tree_sha, session=requests, max_workers=8):
+    """
+    List every blob under a tree that is too large for a single recursive request.
+
+    The root is listed non-recursively and every subtree is then requested
+    recursively on a pool of `max_workers` threads. Only subtrees that are
+    themselves truncated are split further, so the number of sequential
+    round trips stays small however deep the tree is. Identical subtrees
+    (same SHA, e.g. vendored copies) are fetched once and reused.
+
+    Returns:
+        Manifest: Every blob
+    """
+    def fetch(sha, recursive):
+        api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{sha}' + ('?recursive=1' if recursive else '')
+        response = session.get(api_url, headers={'Accept': 'application/vnd.github+json'}, stream=True)
+        if response.status_code != 200:
+            raise GitHubAPIError(response.status_code, response.text)
+        return read_tree(response)
+
+    # Per tree SHA: blobs (path relative to that tree) and direct subtrees still to expand
+    blobs, subtrees = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetch = bind_context(fetch)
+        pending = {pool.submit(fetch, tree_sha, False): (tree_sha, False)}
+        requested = {tree_sha}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sha, recursive = pending.pop(future)
+                data, tree_blobs, tree_subtrees = future.result()
+                if recursive and data.get('truncated'):
+                    pending[pool.submit(fetch, sha, False)] = (sha, False)
+                    continue
+
+                blobs[sha] = tree_blobs
+                subtrees[sha] = []
+                if recursive:
+                    continue
+                subtrees[sha] = tree_subtrees
+                for name, child in tree_subtrees:
+                    if child not in requested:
+                        requested.add(child)
+                        pending[pool.submit(fetch, child, True)] = (child, True)
+
+    logger.info(f"Fetched {len(requested)} distinct subtrees of {owner}/{repo}",
+                extra={'stage': 'tree', 'counts': {'subtrees': len(requested)}})
+    entries = Manifest()
+    stack = [('', tree_sha)]
+    while stack:
+        prefix, sha = stack.pop()
+        entries.extend(blobs[sha], prefix)
+        stack.extend((f'{prefix}{name}/', child) for name, child in subtrees[sha])
+    return entries
+
+
+def get_head_commit(owner, repo, ref, session=requests):
+    """
+    Resolve a branch (or any ref) to its head commit SHA.
+    Uses the sha media type so the response body is only the 40-character SHA.
+    """
+    api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{ref}'
+    response = session.get(api_url, headers={'Accept': 'application/vnd.github.sha'})
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text)
+    return response.text.strip()
+
+
+# The compare API lists at most this many changed files
+COMPARE_MAX_FILES = 300
+
+
+def compare_commits(owner, repo, base, head, session=requests):
+    """
+    List the files changed between two commits.
+
+    Returns:
+        list: The 'files' entries of the compare response (each with
+        'filename', 'status' and, for renames, 'previous_filename'), or None
+        when the comparison cannot be used as a patch: head is not strictly
+        ahead of base (e.g. after a force push) or the file list was capped.
+    """
+    api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/compare/{base}...{head}'
+    response = session.get(api_url, headers={'Accept': 'application/vnd.github+json'})
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text)
+
+    data = response.json()
+    files = data.get('files', [])
+    if data.get('status') not in ('ahead', 'identical') or len(files) >= COMPARE_MAX_FILES:
+        return None
+    return files
+
+
+def get_commit_tree(owner, repo, commit, session=requests):
+    """
+    Look up the SHA of the root tree of a commit. The response is small,
+    unlike the tree itself, so identical trees can be found before fetching any.
+    """
+    api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/git/commits/{commit}'
+    response = session.get(api_url, headers={'Accept': 'application/vnd.github+json'})
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text)
+    return response.json()['tree']['sha']
+
+
+def list_account_repos(owner, session=requests, include_forks=True, include_archived=True):
+    """
+    List the public repositories of a user or organization, following the
+    pagination of the REST API (100 repositories per page).
+
+    Args:
+        owner (str): User or organization
+        session: requests module or requests.Session used for the calls
+        include_forks (bool): Keep forks
+        include_archived (bool): Keep archived repositories
+
+    Returns:
+        list: Dicts with the 'name', 'default_branch' and 'fork' of every repository, by name
+    """
+    api_url = f'{GITHUB_API_URL}/users/{owner}/repos?per_page=100&sort=full_name'
+    repos = []
+    while api_url:
+        response = session.get(api_url, headers={'Accept': 'application/vnd.github+json'})
+        if response.status_code != 200:
+            raise GitHubAPIError(response.status_code, response.text)
+        for item in response.json():
+            if (item.get('fork') and not include_forks) or (item.get('archived') and not include_archived):
+                continue
+            repos.append({'name': item['name'], 'default_branch': item.get('default_branch'), 'fork': bool(item.get('fork'))})
+        api_url = response.links.get('next', {}).get('url')
+    logger.info(f"Listed {len(repos)} repositories of {owner}", extra={'stage': 'accounts', 'counts': {'repos': len(repos)}})
+    return repos
+
+
+def extract_account(url):
+    """
+    Extract the user or organization from a GitHub account URL, such as
+    https://github.com/owner or https://github.com/orgs/owner.
+
+    Returns:
+        str: The account name, or None when the URL is not an account URL
+    """
+    match = re.search(r"github\.com/(?:orgs/)?([\w-]+)/?(?:[?#].*)?$", url.strip())
+    return match.group(1) if match else None
+
+
+def extract_repo_details(repo_url):
+    """
+    Extract owner, repository name, and branch from a GitHub URL.
+    Supports various GitHub URL formats including:
+    - https://github.com/owner/repo
+    - https://github.com/owner/repo.git
+    - git@github.com:owner/repo.git
+    - https://github.com/owner/repo/tree/branch
+    
+    Args:
+        repo_url (str): GitHub repository URL
+        
+    Returns:
+        tuple: (owner, repo, branch)
+    """
+    # Clean up the URL first
+    repo_url = repo_url.strip()
+    
+    # Extract owner and repo name, handling optional .git suffix
+    base_pattern = r"github\.com[:/]([\w-]+)/([\w.-]+?)(?:\.git)?(?:/|$)"
+    base_match = re.search(base_pattern, repo_url)
+    if not base_match:
+        raise ValueError("Invalid GitHub repository URL provided.")
+    
+    owner, repo = base_match.groups()
+    
+    # Extract branch if specified in the URL
+    # This handles formats like /tree/main or /tree/feature/branch
+    branch_pattern = r"/tree/([^/]+(?:/[^/]+)*)"
+    branch_match = re.search(branch_pattern, repo_url)
+    branch = branch_match.group(1) if branch_match else None
+    
+    # Log the extracted details
+    logger.info(
+        f"Extracted repository details - "
+        f"Owner: {owner}, "
+        f"Repo: {repo}, "
+        f"Branch: {branch if branch else 'default'}"
+    )
+    
+    return owner, repo, branch
+
+
+def _pkt_line(data):
+    return f'{len(data) + 4:04x}{data}'.encode('utf-8')
+
+
+def _parse_pkt_lines(body):
+    lines, pos = [], 0
+    while pos + 4 <= len(body):
+        length = int(body[pos:pos + 4], 16)
+        if length < 4:
+            # flush/delim packets
+            pos += 4
+            continue
+        lines.append(body[pos + 4:pos + length].decode('utf-8').rstrip('\n'))
+        pos += length
+    return lines
+
+
+def ls_remote(owner, repo, branch=None, session=requests, timeout=10):
+    """
+    Discover HEAD (and optionally one branch) with a single git protocol v2 ls-refs request.
+    This goes to github.com rather than the REST API, so it costs no API rate-limit budget.
+    Through a GitHubScheduler session it is retried and counted like any other request.
+
+    Returns:
+        dict: ref name -> (commit sha, symref target or None)
+    """
+    body = _pkt_line('command=ls-refs\n') + b'0001' + _pkt_line('symrefs\n') + _pkt_line('ref-prefix HEAD\n')
+    if branch:
+        body += _pkt_line(f'ref-prefix refs/heads/{branch}\n')
+    body += b'0000'
+    response = session.post(
+        f'{GITHUB_URL}/{owner}/{repo}.git/git-upload-pack',
+        data=body,
+        headers={
+            'Content-Type': 'application/x-git-upload-pack-request',
+            'Accept': 'application/x-git-upload-pack-result',
+            'Git-Protocol': 'version=2',
+        },
+        timeout=timeout,
+    )
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text[:200])
+
+    refs = {}
+    for line in _parse_pkt_lines(response.content):
+        parts = line.split(' ')
+        if len(parts) < 2 or not COMMIT_SHA_PATTERN.match(parts[0]):
+            raise GitHubAPIError(response.status_code, f"Unexpected ls-refs response: {line[:200]}")
+        target = next((p[len('symref-target:'):] for p in parts[2:] if p.startswith('symref-target:')), None)
+        refs[parts[1]] = (parts[0], target)
+    return refs
+
+
+_resolved_refs = OrderedDict()
+_resolved_refs_lock = threading.Lock()
+
+
+def resolve_ref(owner, repo, branch=None, session=requests, ttl=REF_TTL):
+    """
+    Resolve a branch (or the default branch when none is given) to its head commit SHA.
+
+    The default branch and its head are found with one ls-refs request, so
+    repositories whose default is master, develop or trunk cost the same as
+    main ones. If that fails, the REST API is used instead. Results are
+    memoized for `ttl` seconds so repeated submissions skip the lookup.
+
+    Returns:
+        tuple: (branch, commit_sha)
+    """
+    if branch and COMMIT_SHA_PATTERN.match(branch):
+        return branch, branch
+
+    key = (owner.lower(), repo.lower(), branch)
+    now = time.time()
+    with _resolved_refs_lock:
+        cached = _resolved_refs.get(key)
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+
+    resolved = None
+    try:
+        refs = ls_remote(owner, repo, branch, session=session)
+        if branch is None and 'HEAD' in refs and refs['HEAD'][1]:
+            resolved = refs['HEAD'][1][len('refs/heads/'):], refs['HEAD'][0]
+        elif branch and f'refs/heads/{branch}' in refs:
+            resolved = branch, refs[f'refs/heads/{branch}'][0]
+    except (requests.RequestException, GitHubAPIError, ValueError) as e:
+        logger.info(f"Ref discovery for {owner}/{repo} failed ({str(e)}), falling back to the REST API")
+
+    if resolved is None:
+        # Tags, abbreviated SHAs, or ref discovery unavailable
+        if branch is None:
+            response = session.get(f'{GITHUB_API_URL}/repos/{owner}/{repo}', headers={'Accept': 'application/vnd.github+json'})
+            if response.status_code != 200:
+                raise GitHubAPIError(response.status_code, response.text)
+            branch = response.json()['default_branch']
+        resolved = branch, get_head_commit(owner, repo, branch, session=session)
+
+    with _resolved_refs_lock:
+        _resolved_refs[key] = (resolved[0], resolved[1], now + ttl)
+        _resolved_refs.move_to_end(key)
+        # Entries are in write order, so expired ones and the overflow are at the front
+        while _resolved_refs:
+            oldest_key, oldest = next(iter(_resolved_refs.items()))
+            if oldest[2] > now and len(_resolved_refs) <= MAX_RESOLVED_REFS:
+                break
+            del _resolved_refs[oldest_key]
+    return resolved
+
+
+def list_files(owner, repo, branch=None, session=requests, cache=None, file_filter=None):
+    """
+    List the files of a repository branch.
+
+    Args:
+        owner (str): Repository owner
+        repo (str): Repository name
+        branch (str): Branch name, or None for the repository's default branch
+        session: requests module or requests.Session used for the calls
+        cache (TreeCache): Optional tree cache
+        file_filter (FileFilter): Optional filter deciding which files are listed
+
+    Returns:
+        tuple: (branch, commit, entries) where entries is a Manifest of every listed file
+    """
+    try:
+        with stage('resolve'):
+            branch, commit = resolve_ref(owner, repo, branch, session=session)
+        logger.info(f"Resolved branch {branch} of {owner}/{repo} to commit {commit}")
+
+        # Fetching the tree by commit makes it immutable, so cache hits need no revalidation
+        with stage('tree_fetch'):
+            tree, source = fetch_tree(owner, repo, commit, session=session, cache=cache)
+        if source == 'cache':
+            message = f"Using cached tree {tree['sha']} for branch: {branch}"
+        elif source == 'revalidated':
+            message = f"Tree for branch {branch} unchanged (304), using cached tree {tree['sha']}"
+        else:
+            message = f"Successfully accessed branch: {branch}"
+        logger.info(message, extra={'stage': 'tree', 'counts': {source: 1}})
+    except RateLimitError:
+        raise
+    except GitHubAPIError as e:
+        logger.info(f"Branch {branch if branch else 'default'} not accessible ({str(e)})")
+        raise ValueError(f"Could not access repository content for branch {branch if branch else 'default'}. Please ensure the repository exists, is public, and contains files.")
+
+    entries = tree['entries']
+    if file_filter is not None:
+        with stage('filter'):
+            entries = file_filter.filter(entries)
+        logger.info(f"Filtered out {len(tree['entries']) - len(entries)} of {len(tree['entries'])} files",
+                    extra={'stage': 'filter', 'counts': {'kept': len(entries), 'excluded': len(tree['entries']) - len(entries)}})
+
+    if not entries:
+        raise ValueError(f"No files found in branch {branch}. Please ensure the repository contains files.")
+    return branch, commit, entries
+
+
+def raw_base_url(owner, repo, branch):
+    return f'https://raw.githubusercontent.com/{owner}/{repo}/{branch}/'
+
+
+def get_raw_urls(owner, repo, branch=None, session=requests, cache=None, file_filter=None):
+    """
+    List the raw.githubusercontent.com URLs of every file in a repository branch.
+
+    Args:
+        owner (str): Repository owner
+        repo (str): Repository name
+        branch (str): Branch name, or None for the repository's default branch
+        session: requests module or requests.Session used for the calls
+        cache (TreeCache): Optional tree cache
+        file_filter (FileFilter): Optional filter deciding which files are listed
+
+    Returns:
+        RawURLs: Raw file URLs (a sequence building them lazily)
+    """
+    branch, commit, entries = list_files(owner, repo, branch, session=session, cache=cache, file_filter=file_filter)
+    return raw_urls(owner, repo, branch, entries)
+
+
+def raw_urls(owner, repo, branch, entries):
+    """
+    Raw file URLs of the entries of a Manifest. The URLs share one base and
+    are only built as they are read, e.g. while writing the sitemap.
+    """
+    # Base URL for raw content
+    base_raw_url = raw_base_url(owner, repo, branch)
+    logger.debug(f"Using base raw URL: {base_raw_url}")
+
+    with stage('url_build'):
+        urls = RawURLs(base_raw_url, entries)
+
+    count('urls', len(urls))
+    logger.info(f"Found {len(urls)} files in branch {branch}", extra={'stage': 'tree', 'counts': {'files': len(urls)}})
+    return urls
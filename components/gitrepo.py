@@ -0,0 +1,287 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+from components.cache import DEFAULT_CACHE_DIR
+from components.github import COMMIT_SHA_PATTERN, GITHUB_URL, raw_urls
+from components.manifest import Manifest
+from components.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Marks the commit lines of `git log` output, so they can't be confused with paths
+COMMIT_MARKER = '\x01'
+
+_mirror_locks = {}
+_mirror_locks_lock = threading.Lock()
+
+
+class GitError(Exception):
+    def __init__(self, message, returncode=None):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+def _git_failed(args, returncode, stderr):
+    return GitError(f"git {' '.join(args)} failed with exit code {returncode}: {stderr.strip()[:500]}", returncode)
+
+
+def _git_missing(git, error):
+    return GitError(f"git is not installed ({git}: {error.strerror or error})")
+
+
+def git_available(git='git'):
+    return shutil.which(git) is not None
+
+
+def _mirror_lock(path):
+    with _mirror_locks_lock:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+
+class GitMirror:
+    """
+    Bare, blobless clone of a repository kept in the cache directory.
+
+    Only commits and trees are downloaded (--filter=blob:none), which is
+    enough to list files and walk their history at a small fraction of the
+    size of a full clone. The first fetch clones, later fetches only
+    download what is new.
+
+    Args:
+        owner (str): Repository owner
+        repo (str): Repository name
+        remote_url (str): Where to fetch from, https://github.com/{owner}/{repo}.git
+            by default; any URL git accepts, e.g. a local bare repository,
+            optionally with {owner} and {repo} placeholders
+        cache_dir (str): Directory holding the mirrors
+        timeout (int): Seconds a git command may take
+    """
+
+    def __init__(self, owner, repo, remote_url=None, cache_dir=None, git='git', timeout=600):
+        # A template such as 'file:///srv/git/{owner}/{repo}.git' is filled in
+        self.remote_url = (remote_url or f'{GITHUB_URL}/{{owner}}/{{repo}}.git').format(owner=owner, repo=repo)
+        cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'git')
+        self.path = os.path.join(cache_dir, owner.lower(), f'{repo.lower()}.git')
+        self.git = git
+        self.timeout = timeout
+
+    @property
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'HEAD'))
+
+    @property
+    def shallow(self):
+        return os.path.exists(os.path.join(self.path, 'shallow'))
+
+    def run(self, *args):
+        """Run a git command in the mirror and return its stdout."""
+        return self._run(['-C', self.path, *args])
+
+    def _run(self, args):
+        try:
+            result = subprocess.run([self.git, *args], capture_output=True, timeout=self.timeout,
+                                    env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+        except subprocess.TimeoutExpired:
+            raise GitError(f"git {' '.join(args)} timed out after {self.timeout}s")
+        except OSError as e:
+            raise _git_missing(self.git, e)
+        if result.returncode != 0:
+            raise _git_failed(args, result.returncode, result.stderr.decode('utf-8', 'replace'))
+        return result.stdout
+
+    def fetch(self, branch, depth=None):
+        """
+        Bring a branch up to date, cloning the repository on first use.
+
+        Args:
+            branch (str): Branch name
+            depth (int): Only fetch this many commits of history; None fetches
+                all of it (and deepens a mirror that was fetched shallow)
+
+        Returns:
+            str: The commit SHA the branch points to
+        """
+        with _mirror_lock(self.path):
+            depth_args = ['--depth', str(depth)] if depth else []
+            if self.exists and not self.shallow:
+                # Never truncate a mirror that has the full history (e.g. for lastmod dates)
+                depth_args = []
+            if not self.exists:
+                # Clone next to the final location, so an interrupted clone never looks like a mirror
+                tmp_path = f'{self.path}.tmp-{os.getpid()}-{threading.get_ident()}'
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                try:
+                    self._run(['clone', '--bare', '--filter=blob:none', '--no-tags', '--single-branch',
+                               '--branch', branch, *depth_args, self.remote_url, tmp_path])
+                    os.replace(tmp_path, self.path)
+                finally:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                logger.info(f"Cloned {self.remote_url} (blobless{', depth ' + str(depth) if depth else ''})",
+                            extra={'stage': 'git', 'counts': {'clones': 1}})
+            else:
+                if depth is None and self.shallow:
+                    depth_args = ['--unshallow']
+                self.run('fetch', '--no-tags', *depth_args, 'origin', f'+refs/heads/{branch}:refs/heads/{branch}')
+                logger.info(f"Fetched {branch} of {self.remote_url}", extra={'stage': 'git', 'counts': {'fetches': 1}})
+            return self.run('rev-parse', f'refs/heads/{branch}^{{commit}}').decode('ascii').strip()
+
+    def remote_head(self, branch=None):
+        """
+        Resolve a branch (the remote's default branch if None) to its head
+        commit with one ls-remote, without cloning anything.
+
+        Returns:
+            tuple: (branch, commit_sha)
+        """
+        args = ['ls-remote', '--symref', self.remote_url, 'HEAD'] + ([f'refs/heads/{branch}'] if branch else [])
+        refs, default = {}, None
+        for line in self._run(args).decode('utf-8').splitlines():
+            if line.startswith('ref: '):
+                target, name = line[len('ref: '):].split('\t')
+                if name == 'HEAD':
+                    default = target
+            else:
+                sha, name = line.split('\t')
+                refs[name] = sha
+        if branch is None:
+            if default is None or not default.startswith('refs/heads/') or 'HEAD' not in refs:
+                raise GitError(f"The HEAD of {self.remote_url} is not a branch")
+            return default[len('refs/heads/'):], refs['HEAD']
+        if f'refs/heads/{branch}' not in refs:
+            raise GitError(f"Branch {branch} not found in {self.remote_url}")
+        return branch, refs[f'refs/heads/{branch}']
+
+    def list_tree(self, commit):
+        """
+        List every file of a commit from the object database.
+
+        Trees are all present in a blobless clone, so no blob is downloaded.
+        Sizes are stored in blobs, not trees, so they are unknown: looking
+        them up would fetch every blob, or scan the whole object database for
+        the few a blobless clone has.
+
+        Returns:
+            Manifest: Every blob, with size None
+        """
+        entries = Manifest()
+        for item in self.run('ls-tree', '-r', '-z', '--full-tree', commit).split(b'\0'):
+            if not item:
+                continue
+            meta, path = item.split(b'\t', 1)
+            mode, kind, sha = meta.decode('ascii').split(' ')
+            # Submodules are 'commit' entries and have no content of their own
+            if kind == 'blob':
+                entries.append(path.decode('utf-8', 'surrogateescape'), None, sha)
+        return entries
+
+    def last_changes(self, commit, paths):
+        """
+        Find when each path was last changed, walking the history from
+        `commit` once and stopping as soon as every path has been seen.
+        Renames are not followed (detecting them would need the blobs).
+
+        Args:
+            commit (str): Commit to start from
+            paths (iterable): Paths to look for
+
+        Returns:
+            dict: path -> committer timestamp (seconds) of the most recent
+            commit touching it, for the paths found in the history
+        """
+        remaining = set(paths)
+        found = {}
+        if not remaining:
+            return found
+
+        args = ['log', f'--format={COMMIT_MARKER}%ct', '--name-only', '-z', '--no-renames', commit, '--']
+        try:
+            process = subprocess.Popen([self.git, '-C', self.path, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+        except OSError as e:
+            raise _git_missing(self.git, e)
+        commits, timestamp, pending = 0, None, b''
+        try:
+            for chunk in iter(lambda: process.stdout.read1(1024 * 1024), b''):
+                tokens = (pending + chunk).split(b'\0')
+                pending = tokens.pop()
+                for token in tokens:
+                    token = token.decode('utf-8', 'surrogateescape').lstrip('\n')
+                    if token.startswith(COMMIT_MARKER):
+                        timestamp = int(token[1:])
+                        commits += 1
+                    elif token in remaining:
+                        found[token] = timestamp
+                        remaining.discard(token)
+                if not remaining:
+                    break
+            else:
+                if process.wait() != 0:
+                    raise _git_failed(args, process.returncode, process.stderr.read().decode('utf-8', 'replace'))
+        finally:
+            # Stops the walk early once every path is dated
+            process.kill()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+        logger.info(f"Walked {commits} commits to date {len(found)} files",
+                    extra={'stage': 'history', 'counts': {'commits': commits, 'dated': len(found)}})
+        return found
+
+
+def list_files_from_clone(owner, repo, branch=None, session=None, cache=None, file_filter=None,
+                          remote_url=None, cache_dir=None, depth=1):
+    """
+    List the files of a repository branch from a local blobless clone instead
+    of the REST trees API: no truncation and no API rate limit, at the cost
+    of a git fetch (a shallow, tree-only one on first use and an incremental
+    one afterwards). Takes and returns the same as components.github.list_files;
+    `session` and `cache` are accepted for that and unused.
+
+    File sizes are not part of git trees, so the size limit of `file_filter`
+    does not apply.
+
+    Args:
+        remote_url (str): Remote URL or {owner}/{repo} template, GitHub by default
+        cache_dir (str): Directory holding the clones
+        depth (int): History fetched on first use (None for all of it)
+
+    Returns:
+        tuple: (branch, commit, entries) where entries is a Manifest of every listed file
+    """
+    mirror = GitMirror(owner, repo, remote_url=remote_url, cache_dir=cache_dir)
+    try:
+        if branch is None:
+            with stage('resolve'):
+                branch, _ = mirror.remote_head()
+        elif COMMIT_SHA_PATTERN.match(branch):
+            raise ValueError("Listing files from a clone needs a branch name, not a commit SHA.")
+        with stage('tree_fetch'):
+            commit = mirror.fetch(branch, depth=depth)
+            entries = mirror.list_tree(commit)
+        logger.info(f"Listed {len(entries)} files of {owner}/{repo}@{branch} ({commit}) from the local clone",
+                    extra={'stage': 'tree', 'counts': {'clone': 1}})
+    except GitError as e:
+        logger.info(f"Branch {branch if branch else 'default'} not accessible ({str(e)})")
+        raise ValueError(f"Could not access repository content for branch {branch if branch else 'default'}. Please ensure the repository exists, is public, and contains files.")
+
+    if file_filter is not None:
+        total = len(entries)
+        with stage('filter'):
+            entries = file_filter.filter(entries)
+        logger.info(f"Filtered out {total - len(entries)} of {total} files",
+                    extra={'stage': 'filter', 'counts': {'kept': len(entries), 'excluded': total - len(entries)}})
+
+    if not entries:
+        raise ValueError(f"No files found in branch {branch}. Please ensure the repository contains files.")
+    return branch, commit, entries
+
+
+def get_raw_urls_from_clone(owner, repo, branch=None, session=None, cache=None, file_filter=None, remote_url=None, cache_dir=None):
+    """Drop-in replacement for components.github.get_raw_urls, listing files from a local clone."""
+    branch, commit, entries = list_files_from_clone(owner, repo, branch, file_filter=file_filter,
+                                                    remote_url=remote_url, cache_dir=cache_dir)
+    return raw_urls(owner, repo, branch, entries)
@@ -0,0 +1,151 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from components.cache import DEFAULT_CACHE_DIR
+from components.gitrepo import GitError, GitMirror, git_available
+from components.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Extensions of prose files, which make the best RAG sources
+DOC_EXTENSIONS = {'md', 'mdx', 'markdown', 'rst', 'txt', 'adoc', 'asciidoc', 'org', 'ipynb'}
+
+# Directories whose files are usually less useful than the code they exercise
+LOW_PRIORITY_DIRECTORIES = {'test', 'tests', 'spec', 'specs', '__tests__', 'testdata', 'fixtures', 'examples', 'example', 'benchmarks'}
+
+
+class HistoryCache:
+    """
+    SQLite cache of when each file was last changed, keyed by path and blob
+    SHA. A file whose content is unchanged has the same blob SHA, so reruns
+    only walk the history for files that are new or were modified since.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, 'history.sqlite3')
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS lastmods (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    blob_sha TEXT NOT NULL,
+                    lastmod INTEGER NOT NULL,
+                    PRIMARY KEY (owner, repo, path, blob_sha)
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return closing(conn)
+
+    def load(self, owner, repo):
+        """Returns: dict (path, blob_sha) -> lastmod timestamp for every cached file of a repository."""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT path, blob_sha, lastmod FROM lastmods WHERE owner = ? AND repo = ?',
+                                (owner.lower(), repo.lower()))
+            return {(path, blob_sha): lastmod for path, blob_sha, lastmod in rows}
+
+    def store(self, owner, repo, rows):
+        """Store (path, blob_sha, lastmod) rows."""
+        owner, repo = owner.lower(), repo.lower()
+        with self._connect() as conn:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO lastmods (owner, repo, path, blob_sha, lastmod) VALUES (?, ?, ?, ?, ?)',
+                                 ((owner, repo, path, blob_sha, lastmod) for path, blob_sha, lastmod in rows))
+
+
+def file_lastmods(owner, repo, branch, commit, entries, cache=None, mirror=None):
+    """
+    Find when every file of a tree was last changed.
+
+    Cached dates are reused by blob SHA; the remaining files are dated by
+    walking the branch history once in a blobless clone (no per-file API
+    calls), stopping as soon as all of them have been seen.
+
+    Args:
+        branch (str): Branch to fetch into the mirror
+        commit (str): Commit the entries were listed from
+        entries (Manifest): Tree entries
+        cache (HistoryCache): Optional cache of previous results
+        mirror (GitMirror): Clone to walk, a GitMirror in the cache directory by default
+
+    Returns:
+        list: Last-change timestamp of each entry (same order), None for files not found in the history
+    """
+    known = cache.load(owner, repo) if cache else {}
+    lastmods = [known.get((path, sha)) for path, size, sha in entries]
+    missing = [path for (path, size, sha), lastmod in zip(entries, lastmods) if lastmod is None]
+    if not missing:
+        return lastmods
+
+    mirror = mirror or GitMirror(owner, repo)
+    mirror.fetch(branch)
+    found = mirror.last_changes(commit, missing)
+
+    new_rows = []
+    for i, (path, size, sha) in enumerate(entries):
+        if lastmods[i] is None and path in found:
+            lastmods[i] = found[path]
+            new_rows.append((path, sha, found[path]))
+    if cache and new_rows:
+        cache.store(owner, repo, new_rows)
+    return lastmods
+
+
+def w3c_datetime(timestamp):
+    """Format a timestamp as the W3C datetime used by <lastmod>, e.g. 2024-05-01T12:30:00+00:00."""
+    return time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(timestamp))
+
+
+def file_priority(path):
+    """
+    Sitemap <priority> of a file from its type and location: READMEs and
+    documentation first, tests and examples last, and lower the deeper the
+    file is nested.
+    """
+    parts = path.lower().split('/')
+    name = parts[-1]
+    extension = name.rsplit('.', 1)[-1] if '.' in name else ''
+    if name.startswith('readme'):
+        priority = 1.0
+    elif extension in DOC_EXTENSIONS:
+        priority = 0.8
+    else:
+        priority = 0.6
+    if any(part in LOW_PRIORITY_DIRECTORIES for part in parts[:-1]):
+        priority -= 0.3
+    priority -= 0.1 * max(0, len(parts) - 2)
+    return round(max(0.1, priority), 1)
+
+
+def sitemap_metadata(owner, repo, branch, commit, entries, lastmod=True, priority=False, cache=None, mirror=None):
+    """
+    <lastmod> and <priority> values for the entries of a sitemap. Dates are
+    left out, with a warning, when git is not installed or the history
+    can't be fetched, rather than failing the whole sitemap.
+
+    Returns:
+        tuple: (lastmods, priorities), each a list in the order of the entries or None when not requested
+    """
+    lastmods = priorities = None
+    if lastmod:
+        if not git_available():
+            logger.warning("git is not installed, sitemap entries won't have a lastmod date")
+        else:
+            try:
+                with stage('history'):
+                    timestamps = file_lastmods(owner, repo, branch, commit, entries, cache=cache, mirror=mirror)
+                lastmods = [w3c_datetime(t) if t is not None else None for t in timestamps]
+            except (GitError, OSError) as e:
+                logger.warning(f"Could not read the history of {owner}/{repo}, sitemap entries won't have a lastmod date ({str(e)})")
+    if priority:
+        priorities = [file_priority(path) for path, size, sha in entries]
+    return lastmods, priorities
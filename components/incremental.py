@@ -0,0 +1,207 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import requests
+
+from components.cache import DEFAULT_CACHE_DIR
+from components.github import compare_commits, fetch_tree, get_head_commit
+from components.sitemap import SitemapWriter
+
+# Incremental sitemaps use smaller shards than the protocol allows, so a small
+# push only rewrites a small file and even 4 KB URLs stay under the 50 MB limit.
+SHARD_SIZE = 10000
+
+
+class ManifestStore:
+    """
+    SQLite store of the last processed commit and file manifest of each repository branch.
+    Every file remembers the sitemap shard it was written to, so a patch only
+    touches the shards whose files changed.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, 'manifests.sqlite3')
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS manifests (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    branch TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    filter TEXT,
+                    PRIMARY KEY (owner, repo, branch)
+                );
+                CREATE TABLE IF NOT EXISTS manifest_files (
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    branch TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    shard INTEGER NOT NULL,
+                    PRIMARY KEY (owner, repo, branch, path)
+                );
+            """)
+            # Stores created before the filter was recorded
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(manifests)')]
+            if 'filter' not in columns:
+                conn.execute('ALTER TABLE manifests ADD COLUMN filter TEXT')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return closing(conn)
+
+    def load(self, owner, repo, branch):
+        """
+        Returns:
+            tuple: (commit_sha, filter, files) where filter is the fingerprint
+            of the file filter the manifest was built with (None for no filter)
+            and files maps path -> shard number, or (None, None, {}) if the
+            branch was never processed
+        """
+        key = (owner.lower(), repo.lower(), branch)
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT commit_sha, filter FROM manifests WHERE owner = ? AND repo = ? AND branch = ?', key).fetchone()
+            if row is None:
+                return None, None, {}
+            files = dict(conn.execute(
+                'SELECT path, shard FROM manifest_files WHERE owner = ? AND repo = ? AND branch = ?', key))
+            return row[0], row[1], files
+
+    def save(self, update):
+        """Persist a ManifestUpdate once its shards have been published."""
+        key = (update.owner.lower(), update.repo.lower(), update.branch)
+        with self._connect() as conn, conn:
+            conn.executemany(
+                'DELETE FROM manifest_files WHERE owner = ? AND repo = ? AND branch = ? AND path = ?',
+                [key + (path,) for path in update.removed])
+            conn.executemany(
+                'INSERT OR REPLACE INTO manifest_files VALUES (?, ?, ?, ?, ?)',
+                [key + (path, update.files[path]) for path in update.added])
+            conn.execute('INSERT OR REPLACE INTO manifests (owner, repo, branch, commit_sha, filter) VALUES (?, ?, ?, ?, ?)',
+                         key + (update.commit, update.filter))
+
+
+class ManifestUpdate:
+    """The patched manifest of a branch plus the shards that need to be rewritten."""
+
+    def __init__(self, owner, repo, branch, commit, files, added, removed, mode, filter=None):
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.commit = commit
+        self.filter = filter
+        self.files = files
+        self.added = added
+        self.removed = removed
+        self.mode = mode
+        self.previous_shards = max(files.values(), default=0)
+        self.dirty = set()
+        self._assign_shards()
+
+    @property
+    def shard_count(self):
+        return max(self.files.values(), default=0)
+
+    @property
+    def index_dirty(self):
+        return self.mode == 'full' or self.shard_count != self.previous_shards
+
+    def _assign_shards(self):
+        counts = {}
+        for shard in self.files.values():
+            counts[shard] = counts.get(shard, 0) + 1
+
+        for path in self.removed:
+            shard = self.files.pop(path)
+            counts[shard] -= 1
+            self.dirty.add(shard)
+
+        # Fill the holes left in existing shards first, then open new ones
+        shard = 1
+        for path in self.added:
+            while counts.get(shard, 0) >= SHARD_SIZE:
+                shard += 1
+            self.files[path] = shard
+            counts[shard] = counts.get(shard, 0) + 1
+            self.dirty.add(shard)
+
+        # Shards past the new last one are simply dropped from the index
+        self.dirty = {shard for shard in self.dirty if shard <= self.shard_count}
+
+    def write_shard(self, shard, directory, base_raw_url):
+        """Write one shard of the sitemap and return the file path."""
+        paths = sorted(path for path, file_shard in self.files.items() if file_shard == shard)
+        # Plain XML: shards are published under stable sitemap-N.xml keys, which every storage serves as is
+        with SitemapWriter(directory, basename=f'shard{shard}', max_urls=SHARD_SIZE) as writer:
+            for path in paths:
+                writer.add(base_raw_url + path)
+            if not writer.shards:
+                # The shard lost all of its files: publish it as an empty urlset
+                writer.open_shard()
+        return writer.shards[0]
+
+
+def sync_manifest(owner, repo, branch, store, session=requests, cache=None, head=None, file_filter=None):
+    """
+    Bring the stored manifest of a branch up to date with its head commit.
+
+    With a previous run on record, the compare API is used to fetch only the
+    added, removed and renamed paths (two requests in total). The full tree is
+    only fetched on the first run, when the comparison can't be used as a
+    patch (force pushes, more changed files than the compare API lists), or
+    when the file filter changed since the last run, since files already in
+    the manifest must then be filtered again.
+
+    Args:
+        head (str): Head commit of the branch, if already resolved
+        file_filter (FileFilter): Optional filter deciding which files are listed.
+            The compare API doesn't report sizes, so patched-in files are only
+            filtered by path.
+
+    Returns:
+        ManifestUpdate: mode is 'unchanged', 'compare', 'tree' (full tree diffed
+        against the stored manifest) or 'full' (first run)
+    """
+    if head is None:
+        head = get_head_commit(owner, repo, branch, session=session)
+    base, base_filter, files = store.load(owner, repo, branch)
+    fingerprint = file_filter.fingerprint if file_filter is not None else None
+    refilter = base is not None and base_filter != fingerprint
+
+    if base == head and not refilter:
+        return ManifestUpdate(owner, repo, branch, head, files, [], [], 'unchanged', fingerprint)
+
+    changes = compare_commits(owner, repo, base, head, session=session) if base and not refilter else None
+    if changes is not None:
+        added, removed = [], []
+        for change in changes:
+            status = change['status']
+            if status == 'removed':
+                removed.append(change['filename'])
+            elif status == 'renamed':
+                removed.append(change['previous_filename'])
+                added.append(change['filename'])
+            elif status in ('added', 'copied'):
+                added.append(change['filename'])
+        if file_filter is not None:
+            added = [path for path in added if file_filter.matches(path)]
+        # A path can only be added if it is new and only removed if we know it
+        removed = [path for path in dict.fromkeys(removed) if path in files]
+        removed_set = set(removed)
+        added = [path for path in dict.fromkeys(added) if path not in files or path in removed_set]
+        return ManifestUpdate(owner, repo, branch, head, files, added, removed, 'compare', fingerprint)
+
+    tree, _ = fetch_tree(owner, repo, head, session=session, cache=cache)
+    entries = file_filter.filter(tree['entries']) if file_filter is not None else tree['entries']
+    paths = list(entries.paths())
+    if base is None:
+        return ManifestUpdate(owner, repo, branch, head, {}, paths, [], 'full', fingerprint)
+    current = set(paths)
+    added = [path for path in paths if path not in files]
+    removed = [path for path in files if path not in current]
+    return ManifestUpdate(owner, repo, branch, head, files, added, removed, 'tree', fingerprint)
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from components.logger import StreamHandler
+from components.metrics import track_run
+
+# Finished jobs kept for polling, oldest dropped first
+MAX_FINISHED_JOBS = 200
+
+# Result table rows kept across finished jobs; each row holds a URL and its status
+MAX_FINISHED_ROWS = 2_000_000
+
+_current_job = ContextVar('current_job', default=None)
+
+
+class Job:
+    """
+    One sitemap generation, run on the job queue's worker pool.
+
+    `status` goes from 'queued' to 'running' to 'done' or 'failed'. While
+    running, `progress` (0 to 1) and `message` describe where the job is;
+    when done, `result` holds whatever the job function returned, and when
+    failed, `error` holds the exception it raised. `log` collects the job's
+    log records and `metrics` its stage timings.
+    """
+
+    def __init__(self, key, log_level=logging.INFO):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Waiting for a worker'
+        self.result = None
+        self.error = None
+        self.log = StreamHandler(level=log_level)
+        self.metrics = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows = 0
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def _count_rows(self):
+        # Results held in memory are dominated by their table, if any
+        table = self.result.get('df') if isinstance(self.result, dict) else None
+        self.rows = len(table) if table is not None else 0
+
+    def set_progress(self, progress, message):
+        self.progress = progress
+        self.message = message
+
+
+def report_progress(progress, message):
+    """Update the progress of the job running in this thread, if any."""
+    job = _current_job.get()
+    if job is not None:
+        job.set_progress(progress, message)
+
+
+class _JobLogRouter(logging.Handler):
+    """Hands each log record to the run log of the job that emitted it."""
+
+    def emit(self, record):
+        job = _current_job.get()
+        # Handler levels are normally checked by the logger, which only knows this router
+        if job is not None and record.levelno >= job.log.level:
+            job.log.handle(record)
+
+
+class JobQueue:
+    """
+    Runs sitemap generations on a pool of worker threads, so a Streamlit
+    session only submits work and polls for it, and a browser refresh does
+    not lose it.
+
+    Jobs are identified by a key (e.g. repository, commit and options). A
+    submission whose key matches a queued or running job returns that job
+    instead of starting a new one, so concurrent users asking for the same
+    sitemap share one computation. Finished jobs stay available by ID until
+    MAX_FINISHED_JOBS newer ones have finished, or until newer results add
+    up to MAX_FINISHED_ROWS table rows; the latest job is always kept.
+
+    Args:
+        max_workers (int): Jobs run at once
+        loggers (iterable): Names of the loggers whose records go into job logs
+    """
+
+    def __init__(self, max_workers=4, loggers=('components',)):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sitemap-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+        self._finished = OrderedDict()
+        self._finished_rows = 0
+        router = _JobLogRouter()
+        for name in loggers:
+            logger = logging.getLogger(name)
+            logger.addHandler(router)
+            # Each job's log applies its own verbosity
+            logger.setLevel(logging.DEBUG)
+
+    def submit(self, key, fn, *args, log_level=logging.INFO, **kwargs):
+        """
+        Queue fn(*args, **kwargs), unless a job with the same key is already
+        queued or running.
+
+        Returns:
+            tuple: (job, coalesced) where coalesced is True when an existing job was returned
+        """
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                return job, True
+            job = Job(key, log_level=log_level)
+            self._jobs[job.id] = job
+            self._active[key] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
+
+    def _run(self, job, fn, args, kwargs):
+        token = _current_job.set(job)
+        job.status = 'running'
+        job.started_at = time.time()
+        job.set_progress(0.0, 'Starting')
+        try:
+            with track_run() as run:
+                job.metrics = run
+                job.result = fn(*args, **kwargs)
+            job.status = 'done'
+            job._count_rows()
+            job.set_progress(1.0, 'Done')
+        except Exception as e:
+            logging.getLogger(__name__).error(f'Error: {str(e)}')
+            job.error = e
+            job.status = 'failed'
+        finally:
+            _current_job.reset(token)
+            job.finished_at = time.time()
+            with self._lock:
+                self._active.pop(job.key, None)
+                self._finished[job.id] = job
+                self._finished_rows += job.rows
+                while len(self._finished) > 1 and (len(self._finished) > MAX_FINISHED_JOBS
+                                                   or self._finished_rows > MAX_FINISHED_ROWS):
+                    expired, expired_job = self._finished.popitem(last=False)
+                    self._finished_rows -= expired_job.rows
+                    self._jobs.pop(expired, None)
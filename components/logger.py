@@ -1,124 +1,153 @@
+import io
 import logging
-import streamlit.components.v1 as components
-import xml.etree.ElementTree as ET
+from collections import deque
+from itertools import islice
+import streamlit as st
 import pandas as pd
+import pyarrow as pa
+
+SORT_OPTIONS = ['Sitemap order', 'A to Z', 'Z to A']
+PAGE_SIZES = [10, 25, 50, 100]
+
+# Rows an Excel worksheet holds, header included
+EXCEL_MAX_ROWS = 1048576
+
+# Lines kept in the run log, and lines shown per log page
+LOG_CAPACITY = 2000
+LOG_PAGE_SIZE = 100
+
+# Values converted to Arrow at a time when building the sitemap DataFrame
+DATAFRAME_BATCH_SIZE = 65536
+LOG_VERBOSITY = {'Errors only': logging.WARNING, 'Summary': logging.INFO, 'Detailed': logging.DEBUG}
 
 class StreamHandler(logging.Handler):
-    def setup_logging():
+    """
+    Bounded run log. The last `capacity` formatted lines are kept in a ring
+    buffer, so the cost of logging stays constant however large the
+    repository is. Records carrying `extra={'stage': ..., 'counts': {...}}`
+    are also summed into per-stage counters, which is how the pipeline
+    reports volumes (files, URLs, uploads) instead of logging every item.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY, level=logging.INFO):
+        super().__init__(level)
+        self.lines = deque(maxlen=capacity)
+        self.counters = {}
+        self.total = 0
+        self.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S'))
+
+    def emit(self, record):
+        counts = getattr(record, 'counts', None)
+        if counts:
+            stage = self.counters.setdefault(getattr(record, 'stage', record.name), {})
+            for name, value in counts.items():
+                stage[name] = stage.get(name, 0) + value
+        self.lines.append(self.format(record))
+        self.total += 1
+
+    @property
+    def dropped(self):
+        return self.total - len(self.lines)
+
+    def page_count(self, page_size=LOG_PAGE_SIZE):
+        return max(1, -(-len(self.lines) // page_size))
+
+    def page(self, page, page_size=LOG_PAGE_SIZE):
+        """Lines of one page of the retained log, oldest first."""
+        start = (page - 1) * page_size
+        return list(islice(self.lines, start, start + page_size))
+
+    @staticmethod
+    def setup_logging(name=None):
         logging.basicConfig(level=logging.INFO)
-        logger = logging.getLogger()
+        # Job logs lower the pipeline loggers to DEBUG; the console stays at INFO
+        for handler in logging.getLogger().handlers:
+            if handler.level == logging.NOTSET:
+                handler.setLevel(logging.INFO)
+        logger = logging.getLogger(name)
         return logger
 
 
-def render_table(df):
-    df_html = df.to_html(index=False, classes="table table-striped table-bordered", border=0, table_id="table")
-    display_table(df_html)
-
-def display_log(log_messages):
-    components.html(f"""
-            <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/css/bootstrap.min.css">
-            <button id="toggleButton" class='btn btn-info'>Show log</button>
-            <div id="log" style="overflow-y: scroll; display: none; border-radius: 10px; background-color: whitesmoke; padding: 10px; margin-top: 10px; height: 300px;">
-            </div>
-            <script>
-
-            var logData = {log_messages};
-            var logDiv = document.getElementById("log");
-            var button = document.getElementById("toggleButton");
-
-            for (var i = 0; i < logData.length; i++) {{
-                var para = document.createElement("p");
-                var node = document.createTextNode(logData[i]);
-                para.appendChild(node);
-                logDiv.appendChild(para);
-            }}
-
-            button.addEventListener('click', function() {{
-                if (logDiv.style.display === "none") {{
-                    logDiv.style.display = "block";
-                    button.textContent = "Hide log";
-                }} else {{
-                    logDiv.style.display = "none";
-                    button.textContent = "Show log";
-                }}
-            }});
-            </script>
-            """, height=500, scrolling=True)
-
-def display_table(df_html):
-    components.html(f"""
-            <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/css/bootstrap.min.css">
-            <link rel="stylesheet" type="text/css" href="https://cdn.datatables.net/1.10.25/css/dataTables.bootstrap.min.css"/>
-
-            <script type="text/javascript" src="https://code.jquery.com/jquery-3.5.1.js"></script>
-            <script type="text/javascript" src="https://cdn.datatables.net/1.10.25/js/jquery.dataTables.min.js"></script>
-            <script type="text/javascript" src="https://cdn.datatables.net/1.10.25/js/dataTables.bootstrap.min.js"></script>
-            <script type="text/javascript" src="https://cdn.datatables.net/buttons/1.3.1/js/dataTables.buttons.min.js"></script> 
-            <script type="text/javascript" src="https://cdnjs.cloudflare.com/ajax/libs/jszip/3.1.3/jszip.min.js"></script>
-            <script type="text/javascript" src="https://cdn.datatables.net/buttons/1.3.1/js/buttons.html5.min.js"></script>
-            {df_html if df_html else ''}
-            <script>
-            $(document).ready(function() {{
-                if($('#table').length > 0){{
-                    $('#table').DataTable({{
-                        "dom": 'Bfrtip',  
-                        "pageLength": 10, // Set the number of rows per page
-                        "paging": true, // Enable pagination
-                        "lengthChange": true, // Disable the ability to change the number of rows per page
-                        "searching": true, // Disable search functionality
-                        "ordering": true, // Enable column sorting
-                        "info": true, // Enable table information display
-                        "buttons": [
-                            'csvHtml5', 'excelHtml5'
-                        ]
-                    }});
-                }}
-            }});
-            </script>
-            <style>
-                .dt-button{{
-                    -webkit-text-size-adjust: 100%;
-                    -webkit-tap-highlight-color: rgba(0,0,0,0);
-                    font-family: "Helvetica Neue",Helvetica,Arial,sans-serif;
-                    box-sizing: border-box;
-                    text-decoration: none;
-                    display: inline-block;
-                    padding: 6px 12px;
-                    margin-bottom: 0;
-                    font-size: 14px;
-                    font-weight: 400;
-                    line-height: 1.42857143;
-                    text-align: center;
-                    white-space: nowrap;
-                    vertical-align: middle;
-                    touch-action: manipulation;
-                    cursor: pointer;
-                    user-select: none;
-                    background-image: none;
-                    border: 1px solid transparent;
-                    border-radius: 4px;
-                    color: #fff;
-                    background-color: #337ab7;
-                    border-color: #2e6da4;
-                }}
-            </style>
-        """, height=500, scrolling=True)
-
-
-def generate_sitemap_dataframe(xml):
-    root = ET.fromstring(xml)
-    data = []
-    for url in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}url'):
-        obj = {}
-        loc = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}loc').text
-        obj['loc'] = loc
-        lastmod_element = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}lastmod')
-        lastmod = lastmod_element.text if lastmod_element is not None else None
-        if lastmod:
-            obj['lastmod'] = lastmod
-
-        # Append the data to the list
-        data.append(obj)
-
-    df = pd.DataFrame(data)
-    return df
\ No newline at end of file
+def render_table(df, key='sitemap_table'):
+    """
+    Render the sitemap URLs one page at a time. Search, sort and pagination run
+    on the server against the DataFrame column, so the browser only ever
+    receives the rows of the current page.
+    """
+    search_col, sort_col, size_col, page_col = st.columns([3, 2, 1, 1])
+    search = search_col.text_input("Search", key=f'{key}_search', placeholder="Filter files...")
+    sort = sort_col.selectbox("Sort", SORT_OPTIONS, key=f'{key}_sort')
+    page_size = size_col.selectbox("Rows", PAGE_SIZES, index=1, key=f'{key}_page_size')
+
+    view = df
+    if search:
+        view = view[view['loc'].str.contains(search, case=False, regex=False)]
+    if sort != SORT_OPTIONS[0]:
+        view = view.sort_values('loc', ascending=sort == SORT_OPTIONS[1])
+
+    pages = max(1, -(-len(view) // page_size))
+    # Keep the current page valid when a new search shrinks the results
+    st.session_state[f'{key}_page'] = min(st.session_state.get(f'{key}_page', 1), pages)
+    page = page_col.number_input("Page", min_value=1, max_value=pages, key=f'{key}_page')
+
+    start = (page - 1) * page_size
+    st.dataframe(view.iloc[start:start + page_size], hide_index=True, use_container_width=True)
+    st.caption(f"Showing {min(start + 1, len(view))}-{min(start + page_size, len(view))} of {len(view)} files (page {page} of {pages})")
+
+    # Exports are only built on request, not on every rerun of the page
+    csv_col, excel_col = st.columns(2)
+    if csv_col.button("Prepare CSV download", key=f'{key}_prepare_csv'):
+        csv_col.download_button("Download CSV", view.to_csv(index=False), file_name='sitemap.csv', mime='text/csv', key=f'{key}_csv')
+    if excel_col.button("Prepare Excel download", key=f'{key}_prepare_excel'):
+        if len(view) >= EXCEL_MAX_ROWS:
+            excel_col.warning(f"Excel sheets hold at most {EXCEL_MAX_ROWS - 1} rows; use the CSV download, or search to narrow down the files.")
+        else:
+            excel_col.download_button("Download Excel", to_excel(view), file_name='sitemap.xlsx', key=f'{key}_excel',
+                                      mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+def to_excel(df):
+    """The DataFrame as the bytes of an .xlsx workbook."""
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, sheet_name='Sitemap', engine='openpyxl')
+    return buffer.getvalue()
+
+def display_log(handler, key='run_log'):
+    """Show the per-stage counters and one page of the run log at a time."""
+    with st.expander("Show log"):
+        if handler.counters:
+            st.dataframe(
+                pd.DataFrame([{'stage': stage, 'counter': name, 'value': value}
+                              for stage, counts in handler.counters.items() for name, value in counts.items()]),
+                hide_index=True)
+        if handler.dropped:
+            st.caption(f"{handler.dropped} older log lines were dropped")
+
+        pages = handler.page_count()
+        st.session_state[f'{key}_page'] = min(st.session_state.get(f'{key}_page', 1), pages)
+        page = st.number_input("Log page", min_value=1, max_value=pages, key=f'{key}_page')
+        st.code('\n'.join(handler.page(page)) or 'No log messages', language=None)
+
+def display_metrics(summary):
+    """Show the stage timings and counters of a run (a RunMetrics.summary())."""
+    with st.expander("Show run metrics"):
+        st.caption(f"Total {summary['total_seconds']}s"
+                   + (f", peak memory {summary['peak_rss_bytes'] / (1024 * 1024):.0f} MB" if summary['peak_rss_bytes'] else ''))
+        st.dataframe(
+            pd.DataFrame([{'metric': f'{stage} (s)', 'value': seconds} for stage, seconds in summary['stages'].items()]
+                         + [{'metric': name, 'value': value} for name, value in summary['counters'].items()]),
+            hide_index=True)
+
+def _arrow_strings(values, batch_size=DATAFRAME_BATCH_SIZE):
+    # Converted in batches, so lazily built URLs never all exist as Python strings at once
+    values = iter(values)
+    batches = iter(lambda: list(islice(values, batch_size)), [])
+    return pd.arrays.ArrowStringArray(pa.chunked_array([pa.array(batch, type=pa.string()) for batch in batches], type=pa.string()))
+
+def generate_sitemap_dataframe(urls, lastmods=None):
+    # Built straight from the URL list so the sitemap XML never has to be parsed back.
+    # Arrow-backed strings keep the column compact and make searching it vectorized.
+    columns = {'loc': _arrow_strings(urls)}
+    if lastmods is not None:
+        columns['lastmod'] = _arrow_strings(lastmods)
+    df = pd.DataFrame(columns)
+    return df
@@ -0,0 +1,167 @@
+from array import array
+from collections.abc import Sequence
+
+# Size stored for files whose size is unknown (e.g. listed from a blobless clone)
+UNKNOWN_SIZE = -1
+
+
+class Manifest(Sequence):
+    """
+    Compact list of the files of a tree, read as (path, size, sha) tuples.
+
+    A list of [path, size, sha] lists costs a few hundred bytes per file,
+    which adds up to hundreds of MB on trees of 500k files. Here every
+    directory prefix is stored once and files only keep an index into it,
+    their name, and their size and binary SHA in parallel arrays, so a file
+    costs little more than its name.
+
+    Tuples are built on access; use paths() when only the paths are needed.
+    """
+
+    def __init__(self, entries=()):
+        self._dirs = []
+        self._dir_ids = {}
+        self._dir_index = array('I')
+        self._names = []
+        self._sizes = array('q')
+        self._shas = bytearray()
+        self._sha_size = None
+        for path, size, sha in entries:
+            self.append(path, size, sha)
+
+    def _dir_id(self, directory):
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self._dirs)
+            self._dirs.append(directory)
+        return dir_id
+
+    def _check_sha_size(self, sha_size):
+        # SHA-1 by default, SHA-256 for repositories using it; never both in one tree
+        if self._sha_size is None:
+            self._sha_size = sha_size
+        elif sha_size != self._sha_size:
+            raise ValueError(f"Object ID of {sha_size} bytes in a manifest of {self._sha_size}-byte IDs")
+
+    def append(self, path, size, sha):
+        sha = bytes.fromhex(sha)
+        if len(sha) != self._sha_size:
+            self._check_sha_size(len(sha))
+        slash = path.rfind('/') + 1
+        directory = path[:slash]
+        dir_id = self._dir_ids.get(directory)
+        self._dir_index.append(self._dir_id(directory) if dir_id is None else dir_id)
+        self._names.append(path[slash:])
+        self._sizes.append(UNKNOWN_SIZE if size is None else size)
+        self._shas += sha
+
+    def extend(self, other, prefix=''):
+        """Append the files of another manifest, with `prefix` (e.g. 'src/') prepended to their paths."""
+        if not len(other):
+            return
+        self._check_sha_size(other._sha_size)
+        dir_ids = [self._dir_id(prefix + directory) for directory in other._dirs]
+        self._dir_index.extend(dir_ids[i] for i in other._dir_index)
+        self._names.extend(other._names)
+        self._sizes.extend(other._sizes)
+        self._shas += other._shas
+
+    def __len__(self):
+        return len(self._names)
+
+    def _entry(self, i):
+        size = self._sizes[i]
+        sha = self._shas[i * self._sha_size:(i + 1) * self._sha_size]
+        return self.path(i), None if size == UNKNOWN_SIZE else size, sha.hex()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(range(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('manifest index out of range')
+        return self._entry(index)
+
+    def __iter__(self):
+        dirs, step, shas = self._dirs, self._sha_size, memoryview(self._shas)
+        for i, (dir_id, name, size) in enumerate(zip(self._dir_index, self._names, self._sizes)):
+            yield dirs[dir_id] + name, None if size == UNKNOWN_SIZE else size, shas[i * step:(i + 1) * step].hex()
+
+    def path(self, i):
+        return self._dirs[self._dir_index[i]] + self._names[i]
+
+    def paths(self, prefix=''):
+        """Iterate over the file paths, optionally prefixed (e.g. with a base URL), without building the sizes and SHAs."""
+        # Prefixing the directories once leaves one concatenation per file
+        dirs = [prefix + directory for directory in self._dirs] if prefix else self._dirs
+        for dir_id, name in zip(self._dir_index, self._names):
+            yield dirs[dir_id] + name
+
+    def sizes(self):
+        """Iterate over the file sizes (None when unknown)."""
+        for size in self._sizes:
+            yield None if size == UNKNOWN_SIZE else size
+
+    def select(self, indices):
+        """Manifest of the files at the given indices (increasing), sharing this one's directory prefixes."""
+        selected = Manifest()
+        selected._dirs = list(self._dirs)
+        selected._dir_ids = dict(self._dir_ids)
+        selected._sha_size = self._sha_size
+        step = self._sha_size
+        for i in indices:
+            selected._dir_index.append(self._dir_index[i])
+            selected._names.append(self._names[i])
+            selected._sizes.append(self._sizes[i])
+            selected._shas += self._shas[i * step:(i + 1) * step]
+        return selected
+
+    def to_json(self):
+        """JSON-serializable form of the manifest, for caching it."""
+        return {
+            'dirs': self._dirs,
+            'dir_index': self._dir_index.tolist(),
+            'names': self._names,
+            'sizes': self._sizes.tolist(),
+            'shas': self._shas.hex(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Inverse of to_json; a plain list of [path, size, sha] entries is accepted too."""
+        if isinstance(data, list):
+            return cls(data)
+        manifest = cls()
+        manifest._dirs = data['dirs']
+        manifest._dir_ids = {directory: i for i, directory in enumerate(data['dirs'])}
+        manifest._dir_index = array('I', data['dir_index'])
+        manifest._names = data['names']
+        manifest._sizes = array('q', data['sizes'])
+        manifest._shas = bytearray.fromhex(data['shas'])
+        if manifest._names:
+            manifest._sha_size = len(manifest._shas) // len(manifest._names)
+        return manifest
+
+
+class RawURLs(Sequence):
+    """
+    URLs of the files of a manifest under a shared base URL, built one at a
+    time as they are read (e.g. while the sitemap is written) instead of
+    being held in memory all at once.
+    """
+
+    def __init__(self, base_url, manifest):
+        self.base_url = base_url
+        self.manifest = manifest if isinstance(manifest, Manifest) else Manifest(manifest)
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RawURLs(self.base_url, self.manifest[index])
+        return self.base_url + self.manifest[index][0]
+
+    def __iter__(self):
+        return self.manifest.paths(self.base_url)
@@ -0,0 +1,225 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+METRIC_PREFIX = 'github2customgpt'
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process, or None where it can't be measured."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and stage duration histograms, plus gauges read
+    from registered callbacks at scrape time, rendered in the Prometheus
+    text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def register_gauges(self, prefix, callback):
+        """
+        Expose the values of the dict returned by callback() as gauges named
+        {prefix}_{key}; None values are skipped. Registering a prefix again
+        replaces its callback.
+        """
+        with self._lock:
+            self._gauges[prefix] = callback
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, {'buckets': [0] * len(STAGE_BUCKETS), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f'# TYPE {METRIC_PREFIX}_{name}_total counter')
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{METRIC_PREFIX}_{name}_total{_labels(labels)} {value}')
+
+            if self._histograms:
+                lines.append(f'# TYPE {METRIC_PREFIX}_stage_seconds histogram')
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(STAGE_BUCKETS, histogram['buckets']):
+                    lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{_labels((("stage", stage), ("le", str(bound))))} {count}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{_labels((("stage", stage), ("le", "+Inf")))} {histogram["count"]}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{_labels((("stage", stage),))} {histogram["sum"]:.6f}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_count{_labels((("stage", stage),))} {histogram["count"]}')
+
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        # Callbacks take their own locks, so they are called outside this one
+        for prefix, callback in gauges:
+            for key, value in sorted(callback().items()):
+                if value is not None:
+                    lines.append(f'# TYPE {METRIC_PREFIX}_{prefix}_{key} gauge')
+                    lines.append(f'{METRIC_PREFIX}_{prefix}_{key} {value}')
+
+        rss = peak_rss_bytes()
+        if rss is not None:
+            lines.append(f'# TYPE {METRIC_PREFIX}_peak_rss_bytes gauge')
+            lines.append(f'{METRIC_PREFIX}_peak_rss_bytes {rss}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RunMetrics:
+    """
+    Stage timings and counters of a single pipeline run (one repository
+    submission). Peak memory is the peak RSS of the whole process, as runs
+    share it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.total_seconds = None
+        self.status = None
+        self.stages = {}
+        self.counters = {}
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, status):
+        self.status = status
+        self.total_seconds = time.perf_counter() - self._started
+
+    def summary(self):
+        with self._lock:
+            return {
+                'status': self.status,
+                'total_seconds': round(self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._started, 3),
+                'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+                'counters': dict(self.counters),
+                'peak_rss_bytes': peak_rss_bytes(),
+            }
+
+
+_current_run = ContextVar('current_run', default=None)
+
+
+@contextmanager
+def track_run():
+    """Collect the stages and counters recorded inside the block into a RunMetrics."""
+    run = RunMetrics()
+    token = _current_run.set(run)
+    status = 'error'
+    try:
+        yield run
+        status = 'ok'
+    finally:
+        _current_run.reset(token)
+        run.finish(status)
+        REGISTRY.inc('runs', status=status)
+
+
+@contextmanager
+def stage(name, run=None):
+    """
+    Time a pipeline stage, for the process-wide histogram and for `run`
+    (by default the run tracked by the enclosing track_run block, if any).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe_stage(name, elapsed)
+        run = run or _current_run.get()
+        if run is not None:
+            run.add_stage(name, elapsed)
+
+
+def count(name, value=1, **labels):
+    """Increment a counter (e.g. requests, bytes, URLs) for the current run and the process."""
+    REGISTRY.inc(name, value, **labels)
+    run = _current_run.get()
+    if run is not None:
+        key = name + ''.join(f'.{label}' for _, label in sorted(labels.items()))
+        run.add(key, value)
+
+
+def register_gauges(prefix, callback):
+    """Expose the dict returned by callback() as process-wide gauges (see MetricsRegistry.register_gauges)."""
+    REGISTRY.register_gauges(prefix, callback)
+
+
+def bind_context(fn):
+    """
+    Wrap a function submitted to a thread pool so it records into the caller's
+    current run; worker threads don't inherit context variables on their own.
+    """
+    context = copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve the registry at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,184 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from components.github import (GITHUB_URL, GitHubAPIError, extract_account, extract_repo_details, fetch_tree,
+                               get_commit_tree, list_account_repos, raw_urls, resolve_ref)
+from components.history import sitemap_metadata
+from components.metrics import bind_context, count, stage
+from components.sitemap import publish_combined_sitemap
+
+logger = logging.getLogger(__name__)
+
+# Repositories resolved and trees fetched at once
+MAX_WORKERS = 8
+
+# Separates the sources of a combined sitemap when typed on one line
+SOURCE_SEPARATOR = re.compile(r'[\s,]+')
+
+
+def split_sources(text):
+    """Split user input into repository and account URLs (separated by spaces, commas or new lines)."""
+    return [source for source in SOURCE_SEPARATOR.split(text.strip()) if source]
+
+
+def _target(owner, repo, branch=None, fork=False):
+    return {'owner': owner, 'repo': repo, 'branch': branch, 'fork': fork, 'commit': None, 'tree': None,
+            'files': 0, 'status': 'ok', 'duplicate_of': None, 'error': None}
+
+
+def target_url(target):
+    """GitHub URL of a target, with its branch when one is set."""
+    url = f"{GITHUB_URL}/{target['owner']}/{target['repo']}"
+    return f"{url}/tree/{target['branch']}" if target['branch'] else url
+
+
+def account_targets(owner, session=requests, include_forks=True, include_archived=True):
+    """The default branch of every public repository of a user or organization, as targets."""
+    try:
+        repos = list_account_repos(owner, session=session, include_forks=include_forks, include_archived=include_archived)
+    except GitHubAPIError as e:
+        logger.info(f"Repositories of {owner} not accessible ({str(e)})")
+        raise ValueError(f"Could not list the repositories of {owner}. Please ensure the user or organization exists.")
+    return [_target(owner, repo['name'], repo['default_branch'], repo['fork']) for repo in repos]
+
+
+def expand_targets(urls, session=requests, include_forks=True, include_archived=True):
+    """
+    Turn repository URLs (with an optional branch) and user or organization
+    URLs into the repositories to cover, listing every repository of each
+    account. A repository and branch given more than once is kept once.
+
+    Returns:
+        list: Target dicts with the 'owner', 'repo', 'branch' (None for the default) and 'fork' of each repository
+    """
+    targets, seen = [], set()
+    for url in urls:
+        account = extract_account(url)
+        if account:
+            expanded = account_targets(account, session=session, include_forks=include_forks, include_archived=include_archived)
+        else:
+            expanded = [_target(*extract_repo_details(url))]
+        for target in expanded:
+            key = (target['owner'].lower(), target['repo'].lower(), target['branch'])
+            if key not in seen:
+                seen.add(key)
+                targets.append(target)
+    if not targets:
+        raise ValueError("No repositories found.")
+    return targets
+
+
+def _fail(target, error):
+    target['status'] = 'error'
+    target['error'] = str(error)
+    logger.warning(f"Skipping {target['owner']}/{target['repo']}: {str(error)}")
+
+
+def build_combined_sitemap(targets, storage, session=requests, cache=None, file_filter=None, lastmod=False, priority=False,
+                           history=None, max_workers=MAX_WORKERS):
+    """
+    Publish one sitemap index covering many repositories.
+
+    Each repository is resolved to its head commit, and each distinct commit
+    to its root tree with one small request. Repositories sharing a tree
+    (forks and mirrors that haven't diverged) are deduplicated: every
+    distinct tree is fetched and listed once, under the first non-fork
+    repository that has it, so the sitemap is sized by distinct content
+    rather than by repository count. A repository that can't be resolved is
+    reported and skipped instead of failing the whole sitemap.
+
+    Args:
+        targets (list): Target dicts, as returned by expand_targets; updated in place
+        storage (StorageBackend): Where the sitemap is published
+        session: requests module or requests.Session used for the calls
+        cache (TreeCache): Optional tree cache
+        file_filter (FileFilter): Optional filter deciding which files are listed
+        lastmod (bool): Add <lastmod> dates from the git history
+        priority (bool): Add <priority> values
+        history (HistoryCache): Optional cache of last-change dates
+        max_workers (int): Repositories processed at once
+
+    Returns:
+        dict: 'url' (None when no file was found), 'files', 'shards',
+        'distinct_trees', 'repos' (the targets, each with its 'commit',
+        'tree', 'files', 'status' ('ok', 'duplicate' or 'error'),
+        'duplicate_of' and 'error') and 'sitemaps', the (urls, lastmods)
+        of every listed repository
+    """
+    def resolve(target):
+        try:
+            target['branch'], target['commit'] = resolve_ref(target['owner'], target['repo'], target['branch'], session=session)
+        except (GitHubAPIError, requests.RequestException) as e:
+            _fail(target, e)
+
+    def commit_tree(target):
+        try:
+            return get_commit_tree(target['owner'], target['repo'], target['commit'], session=session)
+        except (GitHubAPIError, requests.RequestException) as e:
+            return e
+
+    def list_tree(target):
+        try:
+            tree, _ = fetch_tree(target['owner'], target['repo'], target['tree'], session=session, cache=cache)
+        except (GitHubAPIError, requests.RequestException) as e:
+            _fail(target, e)
+            return None
+        entries = tree['entries']
+        if file_filter is not None:
+            with stage('filter'):
+                entries = file_filter.filter(entries)
+        target['files'] = len(entries)
+        urls = raw_urls(target['owner'], target['repo'], target['branch'], entries)
+        lastmods, priorities = sitemap_metadata(target['owner'], target['repo'], target['branch'], target['commit'], entries,
+                                                lastmod=lastmod, priority=priority, cache=history)
+        if lastmod and lastmods is None:
+            # Keeps the dates of the other repositories aligned with their URLs
+            lastmods = [None] * len(entries)
+        return urls, lastmods, priorities
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        with stage('resolve'):
+            list(pool.map(bind_context(resolve), targets))
+
+        # Repositories at the same commit have the same tree without asking
+        by_commit = {}
+        for target in targets:
+            if target['status'] == 'ok':
+                by_commit.setdefault(target['commit'], []).append(target)
+        with stage('tree_resolve'):
+            tree_shas = list(pool.map(bind_context(commit_tree), [group[0] for group in by_commit.values()]))
+        for group, tree_sha in zip(by_commit.values(), tree_shas):
+            for target in group:
+                if isinstance(tree_sha, Exception):
+                    _fail(target, tree_sha)
+                else:
+                    target['tree'] = tree_sha
+
+        # The first non-fork repository with a tree lists it, the others are duplicates
+        canonical = {}
+        for target in sorted((t for t in targets if t['status'] == 'ok'), key=lambda t: t['fork']):
+            first = canonical.setdefault(target['tree'], target)
+            if first is not target:
+                target['status'] = 'duplicate'
+                target['duplicate_of'] = f"{first['owner']}/{first['repo']}"
+        listed = [target for target in targets if target['status'] == 'ok']
+        duplicates = sum(1 for target in targets if target['status'] == 'duplicate')
+        logger.info(f"{len(targets)} repositories have {len(listed)} distinct trees ({duplicates} duplicates)",
+                    extra={'stage': 'dedup', 'counts': {'repos': len(targets), 'distinct_trees': len(listed), 'duplicates': duplicates}})
+        count('trees_deduplicated', duplicates)
+
+        with stage('tree_fetch'):
+            sitemaps = [sitemap for sitemap in pool.map(bind_context(list_tree), listed) if sitemap is not None]
+
+    url, files, shards = publish_combined_sitemap(sitemaps, storage)
+    return {
+        'url': url,
+        'files': files,
+        'shards': shards,
+        'distinct_trees': len(listed),
+        'repos': targets,
+        'sitemaps': [(urls, lastmods) for urls, lastmods, priorities in sitemaps],
+    }
@@ -0,0 +1,222 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from components.github import RateLimitError
+from components.metrics import count
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# (connect, read) timeout in seconds of a request that doesn't set its own
+REQUEST_TIMEOUT = (10, 60)
+
+
+def tokens_from_env():
+    """GitHub tokens from the comma-separated GITHUB_TOKENS (or single GITHUB_TOKEN) environment variable."""
+    tokens = os.environ.get('GITHUB_TOKENS') or os.environ.get('GITHUB_TOKEN') or ''
+    return [token.strip() for token in tokens.split(',') if token.strip()]
+
+
+class _TokenState:
+    def __init__(self, token):
+        self.token = token
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+
+    def available(self, now):
+        return self.remaining is None or self.remaining > 0 or now >= self.reset
+
+
+class GitHubScheduler:
+    """
+    Shared gateway for every GitHub request. It is a drop-in replacement for
+    the `session` argument of the functions in components.github.
+
+    - Requests are spread over a pool of tokens (anonymous if none are
+      configured), always using the token with the most budget left.
+    - X-RateLimit-Remaining/Reset are tracked per token; once a token runs
+      low, requests are spaced out evenly until its reset, and when every
+      token is exhausted callers wait for the earliest reset.
+    - 429, 5xx, connection errors, timeouts and rate-limit 403s are retried with
+      jittered exponential backoff, honouring Retry-After. A 403 that is
+      not about rate limits is returned as is.
+    - At most `max_concurrency` requests are in flight; callers waiting for
+      a slot or for budget are counted in the queue depth.
+    """
+
+    def __init__(self, tokens=None, session=None, max_concurrency=10, max_retries=5,
+                 backoff_base=1.0, backoff_max=60.0, pace_below=50, max_wait=900):
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+            session.mount('https://', adapter)
+        self.session = session
+        self.tokens = [_TokenState(token) for token in (tokens or [None])]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._next_request_at = 0.0
+        self._queue_depth = 0
+        self._in_flight = 0
+        self._requests = 0
+        self._retries = 0
+        self._throttled_seconds = 0.0
+
+    def get(self, url, headers=None, **kwargs):
+        return self._request('get', url, headers, kwargs)
+
+    def post(self, url, headers=None, **kwargs):
+        """
+        POST to github.com (e.g. a git protocol ls-refs request), with the
+        same slots, timeout and retries as get(). These requests don't count
+        against the REST API rate limit, so no token is sent or spent.
+        """
+        return self._request('post', url, headers, kwargs, api=False)
+
+    def _request(self, method, url, headers, kwargs, api=True):
+        headers = dict(headers or {})
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        send = getattr(self.session, method)
+        with self._lock:
+            self._queue_depth += 1
+        self._slots.acquire()
+        try:
+            for attempt in range(self.max_retries + 1):
+                if api:
+                    state = self._acquire_token()
+                    if state.token:
+                        headers['Authorization'] = f'Bearer {state.token}'
+                else:
+                    self._start_request()
+                try:
+                    response = send(url, headers=headers, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self._backoff(attempt, f"{'timeout' if isinstance(e, requests.Timeout) else 'connection error'} ({e})")
+                    continue
+                finally:
+                    with self._lock:
+                        self._in_flight -= 1
+
+                count('github_requests', endpoint='rest' if api else 'git', status=response.status_code)
+                if not kwargs.get('stream'):
+                    # Streamed bodies are counted by whoever reads them
+                    count('github_bytes', len(response.content))
+                if api:
+                    self._update_budget(state, response)
+                if not self._should_retry(response):
+                    return response
+                if attempt == self.max_retries:
+                    break
+                # Hands a streamed response's connection back to the pool before retrying
+                response.close()
+                if api and response.headers.get('X-RateLimit-Remaining') == '0':
+                    # Token exhausted: the next attempt switches token or waits for the reset
+                    with self._lock:
+                        self._retries += 1
+                        self._queue_depth += 1
+                    continue
+                self._backoff(attempt, f"status {response.status_code}", response.headers.get('Retry-After'))
+        finally:
+            self._slots.release()
+
+        if response.status_code in (403, 429):
+            raise RateLimitError(response.status_code, response.text)
+        return response
+
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            known = [s.remaining for s in self.tokens if s.remaining is not None]
+            return {
+                'tokens': len(self.tokens),
+                'budget_remaining': sum(s.remaining if now < s.reset else (s.limit or 0) for s in self.tokens if s.remaining is not None) if known else None,
+                'budget_limit': sum(s.limit for s in self.tokens if s.limit is not None) or None,
+                'next_reset': min((s.reset for s in self.tokens if s.remaining is not None), default=None),
+                'queue_depth': self._queue_depth,
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'retries': self._retries,
+                'throttled_seconds': round(self._throttled_seconds, 3),
+            }
+
+    def _acquire_token(self):
+        """Pick the token with the most budget, waiting for a reset or a pacing slot if needed."""
+        while True:
+            with self._lock:
+                now = time.time()
+                available = [s for s in self.tokens if s.available(now)]
+                if not available:
+                    delay = min(s.reset for s in self.tokens) - now
+                    if delay > self.max_wait:
+                        self._queue_depth -= 1
+                        raise RateLimitError(403, f"GitHub rate limit exhausted for all tokens, next reset in {int(delay)}s")
+                else:
+                    delay = self._next_request_at - now
+                    if delay <= 0:
+                        state = max(available, key=lambda s: s.remaining if s.remaining is not None and now < s.reset else float('inf'))
+                        if state.remaining is not None and now < state.reset:
+                            state.remaining -= 1
+                            if state.remaining < self.pace_below:
+                                # Spread what is left of the budget evenly until the reset
+                                self._next_request_at = now + (state.reset - now) / max(state.remaining, 1)
+                        self._queue_depth -= 1
+                        self._in_flight += 1
+                        self._requests += 1
+                        return state
+                self._throttled_seconds += delay
+            logger.info(f"GitHub budget low, waiting {delay:.1f}s", extra={'stage': 'github', 'counts': {'throttled': 1}})
+            time.sleep(delay)
+
+    def _start_request(self):
+        # The bookkeeping of _acquire_token, for requests that need no token
+        with self._lock:
+            self._queue_depth -= 1
+            self._in_flight += 1
+            self._requests += 1
+
+    def _update_budget(self, state, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        limit = response.headers.get('X-RateLimit-Limit')
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            state.remaining = int(remaining)
+            state.reset = float(reset)
+            state.limit = int(limit) if limit is not None else state.limit
+
+    def _should_retry(self, response):
+        if response.status_code in RETRY_STATUSES:
+            return True
+        if response.status_code == 403:
+            # Primary (remaining == 0) or secondary rate limit, as opposed to a permission error
+            return response.headers.get('X-RateLimit-Remaining') == '0' or 'rate limit' in response.text.lower()
+        return False
+
+    def _backoff(self, attempt, reason, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            # Full jitter: uniform in [0, base * 2^attempt], capped
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        with self._lock:
+            self._retries += 1
+            self._throttled_seconds += delay
+            self._queue_depth += 1
+        logger.warning(f"GitHub request failed with {reason}, retrying in {delay:.1f}s",
+                       extra={'stage': 'github', 'counts': {'retries': 1}})
+        time.sleep(delay)
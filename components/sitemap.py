@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from components.metrics import bind_context, count, stage
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# Limits from the sitemap protocol (https://www.sitemaps.org/protocol.html)
+MAX_URLS_PER_SITEMAP = 50000
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+
+XML_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = XML_HEADER + f'<urlset xmlns="{SITEMAP_NS}">\n'.encode('utf-8')
+URLSET_CLOSE = b'</urlset>\n'
+SITEMAPINDEX_OPEN = XML_HEADER + f'<sitemapindex xmlns="{SITEMAP_NS}">\n'.encode('utf-8')
+SITEMAPINDEX_CLOSE = b'</sitemapindex>\n'
+
+# Shards uploaded at once
+UPLOAD_WORKERS = 8
+
+
+class _GzipFile(gzip.GzipFile):
+    """GzipFile that also closes the file it writes to."""
+
+    def close(self):
+        fileobj = self.fileobj
+        super().close()
+        if fileobj is not None:
+            fileobj.close()
+
+
+def open_gzip(path):
+    # No file name and a fixed mtime in the header, so identical content compresses to identical bytes
+    return _GzipFile(filename='', mode='wb', fileobj=open(path, 'wb'), mtime=0, compresslevel=6)
+
+
+class SitemapWriter:
+    """
+    Streams <url> entries to disk one at a time instead of building the
+    whole urlset in memory. A new numbered shard file is started whenever
+    the current one would go over the URL-count or byte limit. With
+    compress=True the shards are gzip files (.xml.gz); the byte limit still
+    applies to the uncompressed XML, as the protocol requires.
+
+    Usage:
+        with SitemapWriter(directory, 'sitemap') as writer:
+            for url in urls:
+                writer.add(url)
+        writer.shards  # ['.../sitemap-1.xml', '.../sitemap-2.xml', ...]
+    """
+
+    def __init__(self, directory, basename='sitemap', max_urls=MAX_URLS_PER_SITEMAP, max_bytes=MAX_SITEMAP_BYTES, compress=False):
+        if max_bytes < len(URLSET_OPEN) + len(URLSET_CLOSE) + 1:
+            raise ValueError(f"max_bytes is too small to hold a sitemap: {max_bytes}")
+        self.directory = directory
+        self.basename = basename
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.shards = []
+        self.url_count = 0
+        self._file = None
+        self._shard_urls = 0
+        self._shard_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, loc, lastmod=None, priority=None):
+        """Add a <url>, with an optional W3C datetime <lastmod> and 0.0-1.0 <priority>."""
+        entry = f'<url><loc>{escape(loc)}</loc>'
+        if lastmod is not None:
+            entry += f'<lastmod>{lastmod}</lastmod>'
+        if priority is not None:
+            entry += f'<priority>{priority:.1f}</priority>'
+        entry = (entry + '</url>\n').encode('utf-8')
+        if len(URLSET_OPEN) + len(entry) + len(URLSET_CLOSE) > self.max_bytes:
+            raise ValueError(f"URL does not fit in a single sitemap: {loc}")
+
+        if (self._file is None
+                or self._shard_urls >= self.max_urls
+                or self._shard_bytes + len(entry) + len(URLSET_CLOSE) > self.max_bytes):
+            self._open_shard()
+
+        self._file.write(entry)
+        self._shard_urls += 1
+        self._shard_bytes += len(entry)
+        self.url_count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(URLSET_CLOSE)
+            self._file.close()
+            self._file = None
+        return self.shards
+
+    def open_shard(self):
+        """Start a new shard; also usable to produce an empty urlset."""
+        self._open_shard()
+
+    def _open_shard(self):
+        self.close()
+        extension = 'xml.gz' if self.compress else 'xml'
+        path = os.path.join(self.directory, f'{self.basename}-{len(self.shards) + 1}.{extension}')
+        self._file = open_gzip(path) if self.compress else open(path, 'wb')
+        self._file.write(URLSET_OPEN)
+        self.shards.append(path)
+        self._shard_urls = 0
+        self._shard_bytes = len(URLSET_OPEN)
+
+
+def write_sitemap_index(path, sitemap_urls):
+    """
+    Write a <sitemapindex> file pointing at the given (already published) sitemap shards.
+
+    Args:
+        path (str): Destination file path
+        sitemap_urls (list): Public URLs of the sitemap shards
+
+    Returns:
+        str: The path that was written
+    """
+    if len(sitemap_urls) > MAX_URLS_PER_SITEMAP:
+        raise ValueError(f"A sitemap index can reference at most {MAX_URLS_PER_SITEMAP} sitemaps.")
+
+    with open(path, 'wb') as f:
+        f.write(SITEMAPINDEX_OPEN)
+        for url in sitemap_urls:
+            f.write(f'<sitemap><loc>{escape(url)}</loc></sitemap>\n'.encode('utf-8'))
+        f.write(SITEMAPINDEX_CLOSE)
+    return path
+
+
+def upload_sitemap_file(storage, path, key):
+    content_encoding = 'gzip' if path.endswith('.gz') else None
+    url = storage.upload_file(path, key, content_type='application/xml', content_encoding=content_encoding)
+    count('uploads')
+    count('upload_bytes', os.path.getsize(path))
+    return url
+
+
+def content_key(path):
+    """Content-addressed key of a file: the SHA-256 of its bytes plus its extension."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    extension = '.xml.gz' if path.endswith('.xml.gz') else os.path.splitext(path)[1]
+    return digest.hexdigest() + extension
+
+
+def upload_content_addressed(storage, path):
+    """
+    Upload a file under its content-addressed key, skipping the upload if an
+    identical file was published before (a HEAD request instead of a PUT).
+
+    Returns:
+        tuple: (url, uploaded)
+    """
+    key = content_key(path)
+    if storage.exists(key):
+        logger.debug(f"Sitemap file {key} already uploaded, skipping")
+        return storage.url(key), False
+    return upload_sitemap_file(storage, path, key), True
+
+
+def _write_urls(writer, urls, lastmods=None, priorities=None):
+    if lastmods is None and priorities is None:
+        for url in urls:
+            writer.add(url)
+    else:
+        lastmods = lastmods if lastmods is not None else itertools.repeat(None)
+        priorities = priorities if priorities is not None else itertools.repeat(None)
+        for url, lastmod, priority in zip(urls, lastmods, priorities):
+            writer.add(url, lastmod, priority)
+
+
+def _upload_shards(storage, shards, directory, index=False):
+    """Upload sitemap shards, plus an index of them when there are several (or `index` is set); returns the URL to publish."""
+    with stage('upload'):
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            uploads = list(pool.map(bind_context(lambda path: upload_content_addressed(storage, path)), shards))
+        if index or len(uploads) > 1:
+            index_path = write_sitemap_index(os.path.join(directory, 'sitemap.xml'), [url for url, _ in uploads])
+            uploads.append(upload_content_addressed(storage, index_path))
+
+    uploaded = sum(1 for _, was_uploaded in uploads if was_uploaded)
+    logger.info(f"Uploaded {uploaded} sitemap files, {len(uploads) - uploaded} were already published",
+                extra={'stage': 'upload', 'counts': {'uploaded': uploaded, 'skipped': len(uploads) - uploaded}})
+    return uploads[-1][0]
+
+
+def publish_sitemap(urls, storage, lastmods=None, priorities=None):
+    """
+    Write the sitemap for a list of URLs and upload it to the storage backend.
+    When the URLs don't fit in one sitemap, every shard is uploaded along
+    with a sitemap index, and the index is what gets published.
+
+    Shards are gzip-compressed and uploaded in parallel under
+    content-addressed keys, so regenerating an unchanged sitemap costs one
+    existence check per file and no upload.
+
+    Args:
+        urls (iterable): Raw file URLs
+        storage (StorageBackend): Where the sitemap is published
+        lastmods (list): Optional <lastmod> W3C datetime of each URL (None to omit)
+        priorities (list): Optional <priority> of each URL (None to omit)
+
+    Returns:
+        tuple: (url, url_count, shard_count), url is None when there were no URLs
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Stream the <url> entries straight to disk, sharding past the sitemap limits
+        with stage('sitemap_write'), SitemapWriter(tmpdir, basename='sitemap', compress=True) as writer:
+            _write_urls(writer, urls, lastmods, priorities)
+
+        if writer.url_count == 0:
+            return None, 0, 0
+        logger.info(f"{writer.url_count} URLs written to {len(writer.shards)} sitemap shards",
+                    extra={'stage': 'sitemap', 'counts': {'urls': writer.url_count, 'shards': len(writer.shards)}})
+        url = _upload_shards(storage, writer.shards, tmpdir)
+
+    return url, writer.url_count, len(writer.shards)
+
+
+def publish_combined_sitemap(sitemaps, storage):
+    """
+    Publish one sitemap index covering several lists of URLs, e.g. the
+    repositories of an organization. Every list gets shards of its own, so
+    the shards of a repository that didn't change keep their
+    content-addressed keys and aren't uploaded again on the next run.
+
+    Args:
+        sitemaps (iterable): (urls, lastmods, priorities) of each list, lastmods and priorities None to omit them
+        storage (StorageBackend): Where the sitemap is published
+
+    Returns:
+        tuple: (url, url_count, shard_count), url is None when there were no URLs
+    """
+    shards, url_count = [], 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with stage('sitemap_write'):
+            for i, (urls, lastmods, priorities) in enumerate(sitemaps):
+                with SitemapWriter(tmpdir, basename=f'sitemap{i}', compress=True) as writer:
+                    _write_urls(writer, urls, lastmods, priorities)
+                shards.extend(writer.shards)
+                url_count += writer.url_count
+
+        if url_count == 0:
+            return None, 0, 0
+        logger.info(f"{url_count} URLs written to {len(shards)} sitemap shards",
+                    extra={'stage': 'sitemap', 'counts': {'urls': url_count, 'shards': len(shards)}})
+        url = _upload_shards(storage, shards, tmpdir, index=True)
+
+    return url, url_count, len(shards)
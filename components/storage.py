@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Files above this size are uploaded in parallel parts
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+
+def s3_client_config(max_pool_connections=32, max_attempts=5, connect_timeout=5, read_timeout=60):
+    """
+    botocore config for the upload path: a connection pool large enough for
+    parallel shard and multipart uploads, adaptive retries, and timeouts so
+    a stalled connection fails fast instead of hanging a worker.
+    """
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={'max_attempts': max_attempts, 'mode': 'adaptive'},
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        tcp_keepalive=True,
+    )
+
+
+class StorageBackend:
+    """
+    Where published sitemaps live. Keys are '/'-separated relative paths;
+    url() returns the public link of a key.
+    """
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def upload_file(self, path, key, content_type='application/xml', content_encoding=None):
+        """Upload a local file and return its public URL."""
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+
+class S3Storage(StorageBackend):
+    """
+    S3 (or any S3-compatible service such as MinIO) backend.
+
+    By default objects are published at https://{bucket}.s3.amazonaws.com/{bucket}/{key},
+    the format used by the hosted app; pass public_url to publish elsewhere.
+    """
+
+    def __init__(self, bucket, access_key_id=None, access_key_secret=None, endpoint_url=None,
+                 public_url=None, client=None, config=None):
+        self.bucket = bucket
+        self.client = client or boto3.client('s3',
+            endpoint_url = endpoint_url or f'https://{bucket}.s3.amazonaws.com/',
+            aws_access_key_id = access_key_id,
+            aws_secret_access_key = access_key_secret,
+            config = config or s3_client_config(),
+        )
+        self.public_url = (public_url or f'https://{bucket}.s3.amazonaws.com/{bucket}').rstrip('/')
+        self.transfer_config = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_THRESHOLD)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            # Without s3:ListBucket, S3 answers 403 instead of 404 for a missing key;
+            # either way the object isn't known to exist, so it gets uploaded
+            if e.response.get('Error', {}).get('Code') in ('403', 'AccessDenied', 'Forbidden', '404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def upload_file(self, path, key, content_type='application/xml', content_encoding=None):
+        extra_args = {'ACL': 'public-read', 'ContentType': content_type}
+        if content_encoding:
+            extra_args['ContentEncoding'] = content_encoding
+        self.client.upload_file(path, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        return self.url(key)
+
+    def url(self, key):
+        return f'{self.public_url}/{key}'
+
+
+class LocalStorage(StorageBackend):
+    """Filesystem backend, e.g. for running the pipeline without AWS or serving a directory locally."""
+
+    def __init__(self, root, base_url=None):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self.base_url = (base_url or f'file://{self.root}').rstrip('/')
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def upload_file(self, path, key, content_type='application/xml', content_encoding=None):
+        destination = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Copy then rename, so readers never see a partially written file; the
+        # temporary name is unique, so concurrent writers of a key don't clash
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix=os.path.basename(destination) + '.', suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            # mkstemp creates owner-only files; published ones must be readable by whoever serves them
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return self.url(key)
+
+    def url(self, key):
+        return f'{self.base_url}/{key}'
+
+
+class MemoryStorage(StorageBackend):
+    """In-memory backend for benchmarks and tests; objects are kept in `objects`."""
+
+    def __init__(self, base_url='memory://sitemaps'):
+        self.base_url = base_url.rstrip('/')
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def exists(self, key):
+        with self._lock:
+            return key in self.objects
+
+    def upload_file(self, path, key, content_type='application/xml', content_encoding=None):
+        with open(path, 'rb') as f:
+            body = f.read()
+        with self._lock:
+            self.objects[key] = {'body': body, 'content_type': content_type, 'content_encoding': content_encoding}
+        return self.url(key)
+
+    def url(self, key):
+        return f'{self.base_url}/{key}'
+
+
+def storage_from_config(config):
+    """
+    Build a storage backend from the app's secrets (a dict like st.secrets).
+
+    The [storage] section picks the backend ('s3' by default, 'local' or
+    'memory'); S3 credentials come from [aws_s3], which may also set
+    endpoint_url and public_url for S3-compatible services such as MinIO.
+    """
+    storage = config.get('storage', {})
+    backend = storage.get('backend', 's3')
+    if backend == 'local':
+        return LocalStorage(storage.get('path', 'sitemaps'), base_url=storage.get('base_url'))
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend != 's3':
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    aws = config['aws_s3']
+    return S3Storage(
+        aws['accountid'],
+        access_key_id=aws.get('access_key_id'),
+        access_key_secret=aws.get('access_key_secret'),
+        endpoint_url=aws.get('endpoint_url'),
+        public_url=aws.get('public_url'),
+        config=s3_client_config(max_pool_connections=int(storage.get('max_pool_connections', 32))),
+    )
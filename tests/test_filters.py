@@ -0,0 +1,143 @@
+import pytest
+
+from components.filters import FileFilter, build_file_filter, glob_to_regex, parse_patterns
+from components.manifest import Manifest
+
+
+def excluded(patterns, path, size=None):
+    return not FileFilter(exclude=patterns, deny_extensions=[], max_size=None).matches(path, size)
+
+
+@pytest.mark.parametrize('pattern, anchored', [
+    ('docs', False),
+    ('docs/', False),
+    ('*.md', False),
+    ('/docs', True),
+    ('/docs/', True),
+    ('docs/api', True),
+    ('docs/api/', True),
+    ('**/build', True),
+])
+def test_anchoring(pattern, anchored):
+    assert glob_to_regex(pattern)[0] == anchored
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    # No slash: any depth
+    ('docs', 'docs/x.md', True),
+    ('docs', 'a/docs/x.md', True),
+    ('*.md', 'a/b/README.md', True),
+    ('README', 'README.md', False),
+    # Leading or inner slash: from the root only
+    ('/docs', 'docs/x.md', True),
+    ('/docs', 'a/docs/x.md', False),
+    ('/docs/', 'docs/x.md', True),
+    ('/docs/', 'a/docs/x.md', False),
+    ('docs/api', 'docs/api/x.md', True),
+    ('docs/api', 'src/docs/api/x.md', False),
+    # Trailing slash: directories only
+    ('build/', 'build/out.js', True),
+    ('build/', 'src/build/out.js', True),
+    ('build/', 'build', False),
+    ('build', 'build', True),
+    # Wildcards
+    ('*.js', 'src/app.js', True),
+    ('src/*.js', 'src/lib/app.js', False),
+    ('src/?.js', 'src/a.js', True),
+    ('src/?.js', 'src/ab.js', False),
+    ('**/fixtures', 'a/b/fixtures/x.json', True),
+    ('**/fixtures', 'fixtures/x.json', True),
+    ('src/**/test_*.py', 'src/test_a.py', True),
+    ('src/**/test_*.py', 'src/a/b/test_a.py', True),
+    ('src/**', 'src/a/b.py', True),
+    ('src/**', 'srcx/a.py', False),
+    ('a**z', 'ab/cz', True),
+])
+def test_globs(pattern, path, expected):
+    assert excluded([pattern], path) == expected
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    ('[ab].txt', 'a.txt', True),
+    ('[ab].txt', 'c.txt', False),
+    ('[a-c].txt', 'b.txt', True),
+    ('[!a].txt', 'b.txt', True),
+    ('[!a].txt', 'a.txt', False),
+    ('[^a].txt', 'a.txt', False),
+    # '!' and '^' are literal past the first character
+    ('[a!]*.txt', '!x.txt', True),
+    ('[a!]*.txt', '^x.txt', False),
+    ('[a^]*.txt', '^x.txt', True),
+    ('[a^]*.txt', 'bx.txt', False),
+    # Like '*' and '?', a negated class doesn't cross '/'
+    ('x[!a]y', 'x/y', False),
+])
+def test_bracket_classes(pattern, path, expected):
+    assert excluded([pattern], path) == expected
+
+
+def test_reinclude():
+    patterns = ['docs/', '!docs/api/']
+    assert excluded(patterns, 'docs/guide.md')
+    assert not excluded(patterns, 'docs/api/index.md')
+    assert not excluded(patterns, 'src/app.py')
+
+
+def test_include():
+    file_filter = FileFilter(include=['src/', '*.md'], exclude=['*_test.py'], deny_extensions=[], max_size=None)
+    assert file_filter.matches('src/app.py')
+    assert file_filter.matches('docs/guide.md')
+    assert not file_filter.matches('setup.py')
+    assert not file_filter.matches('src/app_test.py')
+
+
+def test_extensions():
+    file_filter = FileFilter(exclude=[], allow_extensions=['.py', 'MD'], deny_extensions=['md'], max_size=None)
+    assert file_filter.matches('src/App.PY')
+    assert not file_filter.matches('README.md')
+    assert not file_filter.matches('Makefile')
+
+    file_filter = FileFilter(exclude=[], max_size=None)
+    assert not file_filter.matches('assets/Logo.PNG')
+    assert file_filter.matches('Makefile')
+
+
+def test_size_cutoff():
+    file_filter = FileFilter(exclude=[], deny_extensions=[], max_size=100)
+    assert file_filter.matches('a.txt', 100)
+    assert not file_filter.matches('a.txt', 101)
+    # Unknown sizes are kept
+    assert file_filter.matches('a.txt', None)
+    assert FileFilter(exclude=[], deny_extensions=[], max_size=None).matches('a.txt', 10 ** 12)
+
+
+def test_defaults():
+    file_filter = build_file_filter()
+    assert not file_filter.matches('node_modules/react/index.js')
+    assert not file_filter.matches('web/dist/app.min.js')
+    assert not file_filter.matches('package-lock.json')
+    assert not file_filter.matches('big.txt', 2 * 1024 * 1024)
+    assert file_filter.matches('src/index.js', 1000)
+
+    file_filter = build_file_filter(use_defaults=False, max_size=0)
+    assert file_filter.matches('node_modules/react/index.js')
+    assert file_filter.matches('big.txt', 2 * 1024 * 1024)
+
+
+def test_filter_manifest():
+    sha = '0' * 40
+    entries = Manifest([('README.md', 10, sha), ('logo.png', 10, sha), ('src/app.py', 5000, sha)])
+    kept = FileFilter(max_size=1000).filter(entries)
+    assert list(kept.paths()) == ['README.md']
+
+
+def test_fingerprint():
+    assert build_file_filter().fingerprint == build_file_filter().fingerprint
+    assert build_file_filter(exclude=['a/', 'b/']).fingerprint == build_file_filter(exclude=['b/', 'a/']).fingerprint
+    assert build_file_filter().fingerprint != build_file_filter(exclude=['tests/']).fingerprint
+    assert build_file_filter().fingerprint != build_file_filter(max_size=0).fingerprint
+
+
+def test_parse_patterns():
+    assert parse_patterns('docs/\n*.md, tests/ \n\n') == ['docs/', '*.md', 'tests/']
+    assert parse_patterns(None) == []
@@ -0,0 +1,118 @@
+import os
+import subprocess
+
+import pytest
+
+from components.gitrepo import GitError, GitMirror, git_available, list_files_from_clone
+
+requires_git = pytest.mark.skipif(not git_available(), reason='git is not installed')
+
+# Committer timestamps of the commits made by the fixture
+FIRST, SECOND = 1700000000, 1700086400
+
+
+def git(*args, cwd=None, timestamp=None):
+    env = {**os.environ, 'GIT_AUTHOR_NAME': 'Test', 'GIT_AUTHOR_EMAIL': 'test@example.com',
+           'GIT_COMMITTER_NAME': 'Test', 'GIT_COMMITTER_EMAIL': 'test@example.com'}
+    if timestamp is not None:
+        env['GIT_AUTHOR_DATE'] = env['GIT_COMMITTER_DATE'] = f'{timestamp} +0000'
+    result = subprocess.run(['git', *args], cwd=cwd, env=env, capture_output=True, check=True)
+    return result.stdout.decode('utf-8').strip()
+
+
+def commit(work, files, message, timestamp):
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(work, path)) or work, exist_ok=True)
+        with open(os.path.join(work, path), 'w') as f:
+            f.write(content)
+    git('add', '-A', cwd=work)
+    git('commit', '-q', '-m', message, cwd=work, timestamp=timestamp)
+    git('push', '-q', 'origin', 'HEAD', cwd=work)
+    return git('rev-parse', 'HEAD', cwd=work)
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A bare repository with two commits on main and a 'dev' branch, plus a working copy pushing to it."""
+    bare = str(tmp_path / 'remote' / 'octo' / 'demo.git')
+    work = str(tmp_path / 'work')
+    git('init', '-q', '--bare', '--initial-branch=main', bare)
+    # Blobless clones need the remote to accept object filters
+    git('config', 'uploadpack.allowFilter', 'true', cwd=bare)
+    git('clone', '-q', bare, work)
+    git('checkout', '-q', '-b', 'main', cwd=work)
+    commit(work, {'README.md': '# Demo\n', 'src/app.py': 'print(1)\n'}, 'First', FIRST)
+    head = commit(work, {'src/app.py': 'print(2)\n', 'docs/guide.md': 'Guide\n'}, 'Second', SECOND)
+    git('push', '-q', 'origin', 'HEAD:refs/heads/dev', cwd=work)
+    return {'url': 'file://' + str(tmp_path / 'remote' / '{owner}' / '{repo}.git'), 'bare': bare, 'work': work, 'head': head}
+
+
+def mirror(remote, tmp_path):
+    return GitMirror('octo', 'demo', remote_url=remote['url'], cache_dir=str(tmp_path / 'cache'))
+
+
+def local_blobs(mirror):
+    objects = mirror.run('cat-file', '--batch-all-objects', '--batch-check=%(objecttype)').decode('ascii').split()
+    return objects.count('blob')
+
+
+@requires_git
+def test_remote_head(remote, tmp_path):
+    m = mirror(remote, tmp_path)
+    assert m.remote_head() == ('main', remote['head'])
+    assert m.remote_head('dev') == ('dev', remote['head'])
+    with pytest.raises(GitError):
+        m.remote_head('missing')
+    # ls-remote alone, nothing is cloned
+    assert not m.exists
+
+
+@requires_git
+def test_shallow_clone(remote, tmp_path):
+    m = mirror(remote, tmp_path)
+    assert m.fetch('main', depth=1) == remote['head']
+    assert m.exists and m.shallow
+    assert m.run('rev-list', '--count', 'main').strip() == b'1'
+
+    entries = m.list_tree(remote['head'])
+    assert sorted(entries.paths()) == ['README.md', 'docs/guide.md', 'src/app.py']
+    assert set(entries.sizes()) == {None}
+    # Listing is served from the trees: no blob was downloaded
+    assert local_blobs(m) == 0
+
+
+@requires_git
+def test_incremental_fetch(remote, tmp_path):
+    m = mirror(remote, tmp_path)
+    m.fetch('main', depth=1)
+    head = commit(remote['work'], {'CHANGELOG.md': 'v2\n'}, 'Third', SECOND + 3600)
+
+    assert m.fetch('main', depth=1) == head
+    assert m.shallow
+    assert 'CHANGELOG.md' in set(m.list_tree(head).paths())
+
+    # Without a depth, a shallow mirror is deepened to the full history
+    assert m.fetch('main') == head
+    assert not m.shallow
+    assert m.run('rev-list', '--count', 'main').strip() == b'3'
+    assert local_blobs(m) == 0
+
+
+@requires_git
+def test_last_changes(remote, tmp_path):
+    m = mirror(remote, tmp_path)
+    m.fetch('main')
+    changes = m.last_changes(remote['head'], ['README.md', 'src/app.py', 'docs/guide.md', 'missing.txt'])
+    assert changes == {'README.md': FIRST, 'src/app.py': SECOND, 'docs/guide.md': SECOND}
+    assert m.last_changes(remote['head'], []) == {}
+
+
+def test_git_missing(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    m = GitMirror('octo', 'demo', remote_url='file:///nowhere/{owner}/{repo}.git', cache_dir=str(tmp_path))
+    with pytest.raises(GitError, match='git is not installed'):
+        m.remote_head()
+    with pytest.raises(GitError, match='git is not installed'):
+        m.last_changes('HEAD', ['README.md'])
+    with pytest.raises(ValueError, match='Could not access repository content'):
+        list_files_from_clone('octo', 'demo', 'main', remote_url='file:///nowhere/{owner}/{repo}.git', cache_dir=str(tmp_path))
@@ -0,0 +1,81 @@
+import json
+import random
+
+import pytest
+
+from components.github import parse_tree_stream
+
+TREE = {
+    'sha': '9fb037999f264ba9a7fc6274d15fa3ae2ab98312',
+    'url': 'https://api.github.com/repos/octo/demo/git/trees/9fb037999f264ba9a7fc6274d15fa3ae2ab98312',
+    'tree': [
+        {'path': 'README.md', 'mode': '100644', 'type': 'blob', 'size': 30,
+         'sha': '44b4fc6d56897b048c772eb4087f854f46256132'},
+        {'path': 'src', 'mode': '040000', 'type': 'tree', 'sha': 'f484d249c660418515fb01c2b9662073663c242e'},
+        {'path': 'src/café "quoted"\\name.py', 'mode': '100644', 'type': 'blob', 'size': 1234567,
+         'sha': '7c258a9869f33c1e1e1f74fbb32f07c86cb5a75b'},
+        {'path': 'vendor/lib', 'mode': '160000', 'type': 'commit', 'sha': 'a3d8f0e7d2b3c4e5f6a7b8c9d0e1f2a3b4c5d6e7'},
+        {'path': 'empty.txt', 'mode': '100644', 'type': 'blob', 'size': 0,
+         'sha': 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'},
+    ],
+    'truncated': False,
+    'ratio': -1.5e-10,
+    'count': 12345,
+    'missing': None,
+}
+
+
+def split(text, rng, pieces):
+    cuts = sorted(rng.sample(range(1, len(text)), min(pieces, len(text) - 1)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def parse(chunks):
+    items = []
+    members = parse_tree_stream(chunks, items.append)
+    return items, members
+
+
+def expected(data):
+    return data['tree'], {key: value for key, value in data.items() if key != 'tree'}
+
+
+@pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+def test_random_chunk_boundaries(separators):
+    text = json.dumps(TREE, separators=separators, indent=None if separators == (',', ':') else 1)
+    rng = random.Random(0)
+    for _ in range(300):
+        assert parse(split(text, rng, rng.randint(1, len(text) // 2))) == expected(TREE)
+
+
+def test_every_single_boundary():
+    text = json.dumps(TREE)
+    for cut in range(1, len(text)):
+        assert parse([text[:cut], text[cut:]]) == expected(TREE)
+
+
+@pytest.mark.parametrize('chunks', [
+    ['{"tree":[],"n":1.', '5e10}'],
+    ['{"tree":[],"n":1', '.5e10}'],
+    ['{"tree":[],"n":1.5e', '10}'],
+    ['{"tree":[],"n":1.5e1', '0}'],
+    ['{"tree":[],"n":', '15000000000.0}'],
+    ['{"tree":[],"n":15000000000.', '0}'],
+])
+def test_number_split_at_boundary(chunks):
+    assert parse(chunks) == ([], {'n': 1.5e10})
+
+
+def test_number_array_items_split_at_boundary():
+    assert parse(['{"tree":[1', '2,3.', '25,-4e', '-1]}']) == ([12, 3.25, -4e-1], {})
+
+
+@pytest.mark.parametrize('chunks', [
+    ['{}'],
+    ['{"sha":"abc"}'],
+    ['{"tree":[{"path":"a"}', ','],
+    ['{"tree":[1,2'],
+])
+def test_invalid_responses(chunks):
+    with pytest.raises(ValueError):
+        parse(chunks)